@@ -0,0 +1,20 @@
+"""
+Benchmarks for the IoT analytics pipeline.
+
+Every service is written to run from its own directory (e.g. ``from db.models import IoTData`` in the API),
+so the service directories are put on ``sys.path`` here before any benchmark imports them. The project directory
+comes last, for the modules shared by all services (``common``).
+"""
+import os
+import sys
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "iot_analytics_project")
+SERVICE_DIRS = ["api", "forwarder", "data_generation", "dashboard", "stream_processor"]
+
+for service in SERVICE_DIRS:
+    path = os.path.join(PROJECT_DIR, service)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+if PROJECT_DIR not in sys.path:
+    sys.path.append(PROJECT_DIR)
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    """
+    Summarize durations measured in seconds.
+    :param durations: one duration per call
+    :return: mean, p50 and p99 in milliseconds, calls per second and number of calls
+    """
+    ordered = sorted(durations)
+    mean = statistics.fmean(ordered)
+    return {
+        "mean_ms": mean * 1000,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "ops_per_s": 1 / mean if mean else float("inf"),
+        "runs": len(ordered),
+    }
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile.
+    :param ordered: sorted values
+    :param q: percentile between 0 and 100
+    :return: the value at the percentile
+    """
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def bench(fn: Callable[[], Any], runs: int = 50, warmup: int = 3) -> Dict[str, float]:
+    """
+    Time a synchronous function.
+    :param fn: function to call, without arguments
+    :param runs: number of measured calls
+    :param warmup: number of calls made before measuring
+    :return: summary of the measured calls
+    """
+    for _ in range(warmup):
+        fn()
+
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+async def abench(fn: Callable[[], Awaitable[Any]], runs: int = 200, warmup: int = 10) -> Dict[str, float]:
+    """
+    Time a coroutine function from within a running event loop.
+    :param fn: coroutine function to await, without arguments
+    :param runs: number of measured calls
+    :param warmup: number of calls made before measuring
+    :return: summary of the measured calls
+    """
+    for _ in range(warmup):
+        await fn()
+
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await fn()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def run_async(coroutine):
+    """Run a coroutine to completion on a fresh event loop."""
+    return asyncio.run(coroutine)
+
+
+def environment() -> Dict[str, str]:
+    """Describe where the results were produced, so runs on different machines are not compared blindly."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except Exception:
+        commit = "unknown"
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": str(os.cpu_count()),
+    }
+
+
+def save_results(results: Dict[str, Any], path: str):
+    """Write results as JSON, creating the parent directory if needed."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Optional[Dict[str, Any]]:
+    """Read results written by ``save_results``, None if the file does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compare two result files benchmark by benchmark.
+    Micro and import time benchmarks regress when their mean time grows, macro benchmarks when their throughput drops.
+    :param results: results of the current run
+    :param baseline: results to compare against
+    :param tolerance: accepted relative slowdown, e.g. 0.2 for 20%
+    :return: one line per regression
+    """
+    regressions = []
+    for suite in ("micro", "importtime"):
+        for name, current in results.get(suite, {}).items():
+            previous = baseline.get(suite, {}).get(name)
+            # Services that could not be imported report an error instead of timings
+            if not previous or "mean_ms" not in current or "mean_ms" not in previous:
+                continue
+            if current["mean_ms"] > previous["mean_ms"] * (1 + tolerance):
+                regressions.append(f"{name}: mean {previous['mean_ms']:.3f} ms -> {current['mean_ms']:.3f} ms")
+
+    for name, current in results.get("macro", {}).items():
+        previous = baseline.get("macro", {}).get(name)
+        if previous and current["messages_per_s"] < previous["messages_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['messages_per_s']:.0f} msg/s -> "
+                               f"{current['messages_per_s']:.0f} msg/s")
+    return regressions
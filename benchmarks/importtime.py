@@ -0,0 +1,98 @@
+"""
+Cold-start import cost of every service, measured with ``python -X importtime`` in a fresh interpreter per run.
+
+Each service is imported the way it starts in its container: from its own directory, with the project directory on
+the path for ``common``. The dashboard script renders the page when imported, so the modules it imports are measured
+instead. The modules the dashboard only imports on demand (scipy for the KDE, adtk for quantile detection) are
+measured separately, to keep track of the cost moved out of the cold start.
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks import PROJECT_DIR
+from benchmarks.harness import summarize
+
+# Service -> (directory, modules imported on start)
+SERVICES: Dict[str, Tuple[str, List[str]]] = {
+    "api": ("api", ["main"]),
+    "forwarder": ("forwarder", ["data_forwarder"]),
+    "data_generation": ("data_generation", ["generate_data"]),
+    "stream_processor": ("stream_processor", ["stream_processor"]),
+    "dashboard": ("dashboard", ["streamlit", "requests", "anomaly_detection", "compute", "plots", "utils"]),
+    "dashboard.on_demand.kde": ("dashboard", ["scipy.stats"]),
+    "dashboard.on_demand.quantile": ("dashboard", ["adtk.data", "adtk.detector"]),
+}
+
+# import time: self [us] | cumulative | imported package
+LINE_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+\d+\s+\|\s*(\S+)")
+TOP_PACKAGES = 5
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Parse the output of ``-X importtime``.
+    :param stderr: standard error of the interpreter
+    :return: total import time in seconds, and seconds spent in every root package (e.g. pandas, fastapi)
+    """
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            self_us, module = match.groups()
+            packages[module.split(".")[0]] += int(self_us)
+    return sum(packages.values()) / 1e6, {package: us / 1e6 for package, us in packages.items()}
+
+
+def measure(directory: str, modules: List[str]) -> Tuple[float, float, Dict[str, float]]:
+    """
+    Import modules in a new interpreter.
+    :param directory: service directory, the working directory of the interpreter
+    :param modules: modules to import
+    :return: import seconds, wall seconds of the whole process, seconds spent in every root package
+    :raises RuntimeError: when the import fails, e.g. a dependency of the service is not installed
+    """
+    cwd = os.path.join(PROJECT_DIR, directory)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([cwd, PROJECT_DIR]))
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+                             cwd=cwd, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+    seconds, packages = parse_importtime(process.stderr)
+    return seconds, wall, packages
+
+
+def run(runs: int = 5) -> Dict[str, dict]:
+    """
+    Measure the import cost of every service.
+    :param runs: measured interpreters per service, after one warm-up run writing the bytecode caches
+    :return: results keyed by service, with the summary of the import times, the p50 wall time of the process
+        and the packages that took longest to import in the last run; services that cannot be imported report
+        the error instead
+    """
+    results = {}
+    for name, (directory, modules) in SERVICES.items():
+        try:
+            measure(directory, modules)
+            durations, walls = [], []
+            for _ in range(runs):
+                seconds, wall, packages = measure(directory, modules)
+                durations.append(seconds)
+                walls.append(wall)
+        except RuntimeError as e:
+            results[f"importtime.{name}"] = {"error": str(e)}
+            continue
+
+        summary = summarize(durations)
+        summary["wall_p50_ms"] = sorted(walls)[len(walls) // 2] * 1000
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:TOP_PACKAGES]
+        summary["top_packages_ms"] = {package: round(seconds * 1000, 1) for package, seconds in heaviest}
+        results[f"importtime.{name}"] = summary
+    return results
@@ -0,0 +1,96 @@
+"""
+Macro-benchmark of the whole pipeline: data generator -> Kafka -> forwarder -> API, with in-memory Kafka and QuestDB.
+"""
+import asyncio
+import time
+from typing import Dict
+
+from benchmarks.harness import percentile, run_async
+from benchmarks.stand_ins import FakePool, InMemoryApplication, InMemoryBroker, api_client
+from common.wire_format import JSON, MSGPACK_V1
+
+TOPIC_NAME = "machinery-data"
+
+
+async def pipeline(devices: int, records_per_device: int, wire_format: str = JSON, run: int = 0) -> Dict[str, float]:
+    """
+    Produce readings from a thread while the forwarder consumes them and posts them to the API.
+    Latency is measured from the moment a message is produced until the API acknowledges it.
+    :param devices: number of simulated devices
+    :param records_per_device: number of readings produced per device
+    :param wire_format: encoding of the messages on the topic
+    :param run: number of the run, to keep the topics of repeated runs apart
+    :return: throughput and latency figures
+    """
+    import data_forwarder
+    from synthetic_iot_data_generator import Device, DeviceTypeOptions, FrequencyOptions, produce_data
+
+    options = DeviceTypeOptions.list()
+    fleet = [Device(device_type=options[i % len(options)], location="production") for i in range(devices)]
+    batches = [(device.device_id, device.create_data_records(records_per_device, FrequencyOptions.hour))
+               for device in fleet]
+    expected = devices * records_per_device
+
+    # One topic per run, message ids of a previous run would be dropped as replays by the API
+    topic = f"{TOPIC_NAME}-{wire_format}-{run}"
+    broker = InMemoryBroker()
+    app = InMemoryApplication(broker)
+    pool = FakePool()
+
+    def generate():
+        for device_id, records in batches:
+            produce_data(topic=topic, device_id=device_id, records=records, app=app,
+                         wire_format=wire_format)
+
+    latencies = []
+    async with api_client(pool) as client:
+        # The forwarder posts to its absolute API_URL, which the ASGI transport serves whatever the host is
+        start = time.perf_counter()
+        producer = asyncio.create_task(asyncio.to_thread(generate))
+
+        while len(latencies) < expected:
+            msg = broker.poll(topic)
+            if msg is None:
+                await asyncio.sleep(0)
+                continue
+
+            await data_forwarder.send_to_api(client, data_forwarder.message_to_payload(msg))
+            latencies.append(time.perf_counter() - msg.produced_at)
+
+        elapsed = time.perf_counter() - start
+        await producer
+
+    latencies.sort()
+    return {
+        "messages": expected,
+        "rows_stored": len(pool.rows),
+        "seconds": elapsed,
+        "messages_per_s": expected / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def median_run(devices: int, records_per_device: int, wire_format: str, repeat: int) -> Dict[str, float]:
+    """
+    Run the pipeline several times and keep the run with the median throughput, a single run of a
+    second or so is easily thrown off by whatever else the machine is doing.
+    """
+    runs = [run_async(pipeline(devices, records_per_device, wire_format, run)) for run in range(repeat)]
+    runs.sort(key=lambda result: result["messages_per_s"])
+    return dict(runs[len(runs) // 2], runs=repeat)
+
+
+def run(devices: int = 10, records_per_device: int = 24 * 7, repeat: int = 3) -> Dict[str, dict]:
+    """
+    Run the pipeline macro-benchmark.
+    :param devices: number of simulated devices
+    :param records_per_device: number of readings produced per device
+    :param repeat: number of runs per wire format, the median one is reported
+    :return: results keyed by benchmark name
+    """
+    return {
+        "pipeline.generator_to_api": median_run(devices, records_per_device, JSON, repeat),
+        "pipeline.generator_to_api_msgpack": median_run(devices, records_per_device, MSGPACK_V1, repeat),
+    }
+
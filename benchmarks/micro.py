@@ -0,0 +1,192 @@
+"""
+Micro-benchmarks of the functions on the hot path of every service.
+"""
+import itertools
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from benchmarks.harness import abench, bench, run_async
+from benchmarks.stand_ins import (FakePool, InMemoryApplication, InMemoryBroker, InMemoryState, NullContainer,
+                                  api_client)
+from common.wire_format import JSON, MSGPACK_V1, encode
+
+RECORDS_PER_DEVICE = 24 * 7
+DEVICES = 10
+
+
+def make_rows(devices: int = DEVICES, records: int = RECORDS_PER_DEVICE) -> List[Dict[str, Any]]:
+    """Rows as stored in ``iot_data``, produced by the data generator."""
+    from synthetic_iot_data_generator import Device, DeviceTypeOptions, FrequencyOptions
+
+    options = DeviceTypeOptions.list()
+    rows = []
+    for i in range(devices):
+        device = Device(device_type=options[i % len(options)], location="production")
+        for record in device.create_data_records(records, FrequencyOptions.hour):
+            rows.append(dict(record, device_id=device.device_id,
+                             timestamp=datetime.strptime(record["timestamp"], "%Y-%m-%d %H:%M:%S")))
+    return rows
+
+
+def as_api_json(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rows as the dashboard receives them from the API."""
+    return [dict(row, timestamp=row["timestamp"].isoformat()) for row in rows]
+
+
+def generator_benchmarks() -> Dict[str, dict]:
+    from synthetic_iot_data_generator import Device, FrequencyOptions, produce_data
+
+    device = Device(device_type="Sensor", location="production")
+    records = device.create_data_records(RECORDS_PER_DEVICE, FrequencyOptions.hour)
+    app = InMemoryApplication(InMemoryBroker())
+
+    return {
+        "generator.create_data_records": bench(
+            lambda: device.create_data_records(RECORDS_PER_DEVICE, FrequencyOptions.hour)),
+        "generator.produce_data": bench(
+            lambda: produce_data(topic="machinery-data", device_id=device.device_id, records=records, app=app,
+                                 wire_format=JSON)),
+        "generator.produce_data_msgpack": bench(
+            lambda: produce_data(topic="machinery-data", device_id=device.device_id, records=records, app=app,
+                                 wire_format=MSGPACK_V1)),
+    }
+
+
+def forwarder_benchmarks() -> Dict[str, dict]:
+    from data_forwarder import message_to_payload
+
+    broker = InMemoryBroker()
+    record = {"timestamp": "2025-01-01 12:34:56", "voltage": 3.7, "current": 0.5,
+              "device_type": "Controller", "location": "warehouse"}
+    key = "4c118ca0-d470-4440-9a87-aff5f61bb138"
+    message = broker.append("machinery-data", key, *encode(record, JSON))
+    msgpack_message = broker.append("machinery-data", key, *encode(record, MSGPACK_V1))
+
+    return {
+        "forwarder.message_to_payload": bench(lambda: message_to_payload(message), runs=10000, warmup=100),
+        "forwarder.message_to_payload_msgpack": bench(lambda: message_to_payload(msgpack_message),
+                                                      runs=10000, warmup=100),
+    }
+
+
+def stream_processor_benchmarks() -> Dict[str, dict]:
+    from stream_processor import init_window, integrate_energy, reduce_window, with_power
+
+    rows = make_rows(devices=1)
+    readings = zip(itertools.count(), itertools.cycle(rows))
+    state = InMemoryState()
+    window = {}
+
+    def derive():
+        # One reading through the stateful steps of the pipeline, up to its hourly window
+        n, row = next(readings)
+        # Timestamps keep increasing across cycles, as they would on the topic
+        reading = with_power(row, row["device_id"], n * 3_600_000, None)
+        reading = integrate_energy(reading, state)
+        window["value"] = reduce_window(window["value"], reading) if "value" in window else init_window(reading)
+
+    return {
+        "stream_processor.derive": bench(derive, runs=10000, warmup=100),
+    }
+
+
+async def api_benchmarks() -> Dict[str, dict]:
+    from routes.cache import result_cache
+
+    rows = make_rows()
+    device_id = rows[0]["device_id"]
+    pool = FakePool(list(rows))
+    start = datetime(2025, 1, 1)
+    sequence = itertools.count()
+    # The readings are generated from now onwards, so a window over them is still open,
+    # while the week before is closed
+    open_window = {"group_by": ["device_type", "location"], "bucket": "1h",
+                   "start": min(row["timestamp"] for row in rows).isoformat(),
+                   "end": (max(row["timestamp"] for row in rows) + timedelta(hours=1)).isoformat()}
+    closed_end = datetime.utcnow() - timedelta(hours=1)
+    closed_window = dict(open_window, start=(closed_end - timedelta(days=7)).isoformat(), end=closed_end.isoformat())
+
+    derived_window = {"start": open_window["start"], "end": open_window["end"]}
+
+    def payload() -> Dict[str, Any]:
+        # Distinct readings, otherwise every request after the first one takes the duplicate path
+        n = next(sequence)
+        return {"timestamp": (start + timedelta(seconds=n)).isoformat(), "device_id": device_id,
+                "voltage": 3.7, "current": 0.5, "device_type": "Controller", "location": "warehouse"}
+
+    def uncached(request):
+        # Every request goes to the database, as on a cache miss
+        def call():
+            result_cache.clear()
+            return request()
+        return call
+
+    async with api_client(pool) as client:
+        return {
+            "api.create_iot_data": await abench(lambda: client.post("/data", json=payload())),
+            "api.get_iot_data_by_device_id": await abench(uncached(lambda: client.get(f"/data/{device_id}"))),
+            "api.get_iot_data_by_device_id_cached": await abench(lambda: client.get(f"/data/{device_id}")),
+            "api.get_all_iot_data": await abench(uncached(lambda: client.get("/data", params={"limit": 1000}))),
+            "api.get_all_iot_data_cached": await abench(lambda: client.get("/data", params={"limit": 1000})),
+            "api.get_all_devices": await abench(lambda: client.get("/devices")),
+            "api.get_latest_readings": await abench(lambda: client.get("/devices/latest")),
+            "api.get_aggregates": await abench(uncached(lambda: client.get("/aggregates", params=open_window))),
+            "api.get_aggregates_cached": await abench(lambda: client.get("/aggregates", params=closed_window)),
+            "api.get_derived": await abench(
+                uncached(lambda: client.get(f"/derived/{device_id}", params=derived_window))),
+        }
+
+
+def dashboard_benchmarks() -> Dict[str, dict]:
+    from compute import AnomalyCompute, AnomalyKey, create_executor, data_version
+    from plots import detect_and_plot_anomalies, render_histogram_chart, render_line_chart, to_time_series
+    from utils import calculate_statistics
+
+    data = as_api_json(make_rows(devices=1))
+    container = NullContainer()
+    compute = AnomalyCompute(create_executor())
+    series = {variable: to_time_series(data, variable) for variable in ("current", "voltage")}
+    runs = itertools.count()
+
+    def detect_both(version=None):
+        # Both panels of the dashboard, detected concurrently in the process pool
+        keys = [AnomalyKey("device", variable, "quantile", 0.01, 0.99, version or data_version(data))
+                for variable in series]
+        futures = [compute.submit(key, series[key.variable]) for key in keys]
+        return [compute.result(key, series[key.variable], future) for key, future in zip(keys, futures)]
+
+    # Spawns the worker processes
+    detect_both(version=(-1,))
+
+    try:
+        return {
+            "dashboard.calculate_statistics": bench(lambda: calculate_statistics(data)),
+            "dashboard.render_line_chart": bench(lambda: render_line_chart(
+                data, container, chart_params=dict(title="Current", color="yellow", variable="current"))),
+            "dashboard.render_histogram_chart": bench(lambda: render_histogram_chart(
+                data, container, chart_params=dict(title="Current", color="yellow", x="current"))),
+            "dashboard.detect_and_plot_anomalies.quantile": bench(lambda: detect_and_plot_anomalies(
+                data, container, chart_params=dict(x="current", anomaly_method="quantile", low=0.01, high=0.99))),
+            "dashboard.detect_and_plot_anomalies.value_based": bench(lambda: detect_and_plot_anomalies(
+                data, container, chart_params=dict(x="current", anomaly_method="value_based", low=0.02, high=0.08))),
+            # A new data version every run, so nothing is memoized
+            "dashboard.compute.detect_both": bench(lambda: detect_both(version=(next(runs),))),
+            "dashboard.compute.detect_both_memoized": bench(detect_both),
+        }
+    finally:
+        # A pool left running keeps importing in its idle workers and slows down the suites that follow
+        compute.executor.shutdown()
+
+
+def run() -> Dict[str, dict]:
+    """
+    Run every micro-benchmark.
+    :return: results keyed by benchmark name
+    """
+    results = {}
+    results.update(generator_benchmarks())
+    results.update(forwarder_benchmarks())
+    results.update(stream_processor_benchmarks())
+    results.update(run_async(api_benchmarks()))
+    results.update(dashboard_benchmarks())
+    return results
@@ -0,0 +1,68 @@
+"""
+Run the benchmarks and store the results as JSON.
+
+    python -m benchmarks.run                                  # every suite, written to benchmarks/results/latest.json
+    python -m benchmarks.run --suite micro --output out.json
+    python -m benchmarks.run --suite importtime              # cold-start import cost of every service
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json --tolerance 0.2
+
+With ``--baseline`` the exit code is 1 when any benchmark got slower than the tolerance allows.
+"""
+import argparse
+import os
+import sys
+
+from benchmarks import importtime, macro, micro
+from benchmarks.harness import environment, find_regressions, load_results, save_results
+from common.log import configure_logging
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SUITES = {"micro": micro.run, "macro": macro.run, "importtime": importtime.run}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the IoT analytics pipeline.")
+    parser.add_argument("--suite", nargs="+", choices=list(SUITES), default=list(SUITES),
+                        help="suites to run (default: all)")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "latest.json"),
+                        help="where to write the results")
+    parser.add_argument("--baseline", default=None,
+                        help="results file to compare against, e.g. benchmarks/results/baseline.json")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="accepted relative slowdown before a benchmark counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    # Quieter than the services by default, their progress records would interleave with the results
+    configure_logging("WARNING")
+
+    results = {"environment": environment()}
+    for suite in args.suite:
+        print(f"Running {suite} benchmarks...")
+        results[suite] = SUITES[suite]()
+        for name, summary in results[suite].items():
+            print(f"  {name}: " + ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                                           for key, value in summary.items()))
+
+    save_results(results, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        baseline = load_results(args.baseline)
+        if baseline is None:
+            print(f"No baseline found at {args.baseline}, nothing to compare against.")
+            return 0
+
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
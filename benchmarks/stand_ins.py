@@ -0,0 +1,251 @@
+"""
+In-memory stand-ins for Kafka, QuestDB and Streamlit, so the pipeline can be benchmarked without any service running.
+Only the parts of the client APIs used by the project are implemented.
+"""
+import queue
+import re
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+
+class InMemoryMessage:
+    """Mimics the ``confluent_kafka.Message`` accessors used by the forwarder."""
+
+    def __init__(self, topic: str, partition: int, offset: int, key: Optional[bytes], value: bytes,
+                 headers: Optional[list] = None):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._timestamp_ms = int(time.time() * 1000)
+        # High resolution production time, used to measure end to end latency
+        self.produced_at = time.perf_counter()
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self):
+        return 0, self._timestamp_ms
+
+    def error(self):
+        return None
+
+
+class InMemoryBroker:
+    """A single partition per topic, backed by thread-safe queues so producers and consumers can run concurrently."""
+
+    def __init__(self):
+        self._topics: Dict[str, "queue.Queue[InMemoryMessage]"] = defaultdict(queue.Queue)
+        self._offsets: Dict[str, int] = defaultdict(int)
+
+    def append(self, topic: str, key, value, headers=None) -> InMemoryMessage:
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+
+        message = InMemoryMessage(topic, 0, self._offsets[topic], key, value, headers)
+        self._offsets[topic] += 1
+        self._topics[topic].put(message)
+        return message
+
+    def poll(self, topic: str, timeout: float = 0) -> Optional[InMemoryMessage]:
+        try:
+            return self._topics[topic].get(timeout=timeout) if timeout else self._topics[topic].get_nowait()
+        except queue.Empty:
+            return None
+
+    def size(self, topic: str) -> int:
+        return self._topics[topic].qsize()
+
+
+class InMemoryProducer:
+    """Mimics the quixstreams producer returned by ``Application.get_producer()``."""
+
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def produce(self, topic: str, value=None, key=None, headers=None, **kwargs):
+        self.broker.append(topic, key, value, headers)
+
+    def flush(self, timeout: Optional[float] = None) -> int:
+        return 0
+
+
+class InMemoryApplication:
+    """Mimics the part of ``quixstreams.Application`` used by the data generator."""
+
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+
+    def get_producer(self) -> InMemoryProducer:
+        return InMemoryProducer(self.broker)
+
+
+class InMemoryState:
+    """Mimics the ``get()/set()`` accessors of the quixstreams state of a message key."""
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+
+    def get(self, key: str, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key: str, value):
+        self._values[key] = value
+
+
+class FakeConnection:
+    """
+    Answers the queries issued by the API from rows kept in memory.
+    Rows are plain dicts, which support the same ``dict(record)`` and ``record[column]`` access as asyncpg records.
+    """
+
+    LIMIT_PATTERN = re.compile(r"LIMIT\s+(\d+)\s*,\s*(\d+)", re.IGNORECASE)
+    GROUP_COLUMNS = ("device_type", "location")
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+
+    def aggregate(self, query: str, start, end) -> List[Dict[str, Any]]:
+        """Group the rows of the window by the columns selected next to the aggregates, ignoring time buckets."""
+        selected = query.split("count()")[0]
+        keys = [column for column in self.GROUP_COLUMNS if column in selected]
+        groups = defaultdict(list)
+        for row in self.rows:
+            if start <= row["timestamp"] < end:
+                groups[tuple(row[column] for column in keys)].append(row)
+
+        result = []
+        for group, rows in groups.items():
+            power = [row["voltage"] * row["current"] for row in rows]
+            result.append(dict(zip(keys, group), timestamp=start, readings=len(rows),
+                               mean_voltage=sum(row["voltage"] for row in rows) / len(rows),
+                               mean_current=sum(row["current"] for row in rows) / len(rows),
+                               mean_power=sum(power) / len(power), max_power=max(power)))
+        return result
+
+    def derived(self, device_id: str, window: str, start, end) -> List[Dict[str, Any]]:
+        """Hourly windows of a device, as written to ``iot_derived`` by the stream processor (window ignored)."""
+        windows = defaultdict(list)
+        for row in self.rows:
+            if row["device_id"] == device_id and start <= row["timestamp"] < end:
+                windows[row["timestamp"].replace(minute=0, second=0, microsecond=0)].append(row)
+
+        result = []
+        for window_start, rows in sorted(windows.items()):
+            power = [row["voltage"] * row["current"] for row in rows]
+            result.append(dict(window_start=window_start, window_end=window_start + timedelta(hours=1),
+                               readings=len(rows), mean_voltage=sum(row["voltage"] for row in rows) / len(rows),
+                               mean_current=sum(row["current"] for row in rows) / len(rows),
+                               mean_power=sum(power) / len(power), max_power=max(power),
+                               energy_wh=sum(power), energy_total_wh=sum(power)))
+        return result
+
+    async def fetch(self, query: str, *args):
+        if "count() AS readings" in query:
+            return self.aggregate(query, *args)
+
+        if "FROM iot_derived" in query:
+            return self.derived(*args)
+
+        if "LATEST ON" in query:
+            latest = {}
+            for row in self.rows:
+                if row["device_id"] not in latest or row["timestamp"] >= latest[row["device_id"]]["timestamp"]:
+                    latest[row["device_id"]] = row
+            return list(latest.values())
+
+        if "DISTINCT device_id" in query:
+            return [{"device_id": device_id} for device_id in dict.fromkeys(row["device_id"] for row in self.rows)]
+
+        rows = self.rows
+        if args:
+            rows = [row for row in rows if row["device_id"] == args[0]]
+
+        limit = self.LIMIT_PATTERN.search(query)
+        if limit:
+            rows = rows[int(limit.group(1)):int(limit.group(2))]
+        return rows
+
+    async def execute(self, query: str, *args):
+        return "OK"
+
+    async def executemany(self, query: str, rows):
+        columns = ["timestamp", "device_id", "voltage", "current", "device_type", "location"]
+        self.rows.extend(dict(zip(columns, row)) for row in rows)
+
+
+class FakePool:
+    """Mimics ``asyncpg.Pool.acquire()/release()`` over a single in-memory table."""
+
+    def __init__(self, rows: Optional[List[Dict[str, Any]]] = None):
+        self.rows = rows if rows is not None else []
+        self._connection = FakeConnection(self.rows)
+
+    async def acquire(self) -> FakeConnection:
+        return self._connection
+
+    async def release(self, connection: FakeConnection):
+        pass
+
+
+class NullContainer:
+    """Stands in for a Streamlit container, discarding whatever is rendered into it."""
+
+    def plotly_chart(self, *args, **kwargs):
+        pass
+
+    def write(self, *args, **kwargs):
+        pass
+
+
+@asynccontextmanager
+async def api_client(pool: FakePool):
+    """
+    Serve the API over an in-process ASGI transport, with the database replaced by ``pool``.
+    The startup/shutdown events do not run over the ASGI transport, so the pieces they manage are set up here.
+    :param pool: fake connection pool the API reads from and writes to
+    """
+    import httpx
+    from db import db_connection
+    from db.latest import latest_readings
+    from db.write_buffer import write_buffer
+    from main import app
+
+    db_connection._pool = pool
+    await latest_readings.start()
+    await write_buffer.start()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api") as client:
+            yield client
+    finally:
+        await write_buffer.stop()
+        await latest_readings.stop()
+        db_connection._pool = None
@@ -1,53 +1,237 @@
 import asyncio
 import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the API only runs as a single development process
+    fcntl = None
+
 import asyncpg
 from loguru import logger
+# from iot_analytics_project.api.instrumentation import DB_ACQUIRE_SECONDS
+# from iot_analytics_project.api.profiling import phase
+from instrumentation import DB_ACQUIRE_SECONDS
+from profiling import phase
+
+# Total number of connections the API may hold against QuestDB, shared by every worker process
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 32))
+# Seconds to wait for in-flight queries to finish on shutdown before connections are terminated
+DB_POOL_CLOSE_TIMEOUT = float(os.getenv("DB_POOL_CLOSE_TIMEOUT", 10))
+
+# Startup waits for the database with exponential backoff: the first retry comes quickly, later ones back off
+DB_RETRY_INITIAL_DELAY = float(os.getenv("DB_RETRY_INITIAL_DELAY", 0.1))
+DB_RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", 5))
+# Seconds a single connection attempt may take, and seconds after which startup gives up altogether
+DB_PROBE_TIMEOUT = float(os.getenv("DB_PROBE_TIMEOUT", 2))
+DB_CONNECT_DEADLINE = float(os.getenv("DB_CONNECT_DEADLINE", 60))
+
+# Held while a worker creates or migrates the tables, so the workers of the API do not migrate concurrently
+SCHEMA_LOCK_FILE = os.getenv("SCHEMA_LOCK_FILE", os.path.join(tempfile.gettempdir(), "iot-api-schema.lock"))
+
+# WAL table partitioned by day with dedup keys, so replayed rows are upserted instead of duplicated
+IOT_DATA_SCHEMA = """(
+    timestamp TIMESTAMP,
+    device_id TEXT NOT NULL,
+    voltage DOUBLE NOT NULL,
+    current DOUBLE NOT NULL,
+    device_type TEXT NOT NULL,
+    location TEXT NOT NULL
+) timestamp(timestamp) PARTITION BY DAY WAL
+DEDUP UPSERT KEYS(timestamp, device_id)"""
+IOT_DATA_COLUMNS = "timestamp, device_id, voltage, current, device_type, location"
+# Rows of an ``iot_data`` table created before the schema above are copied into MIGRATION_TABLE, which then
+# takes its name; the old table is kept as LEGACY_TABLE until it is dropped by hand
+MIGRATION_TABLE = "iot_data_migration"
+LEGACY_TABLE = "iot_data_legacy"
+
+_pool: Optional[asyncpg.Pool] = None
+
+
+def _connection_kwargs() -> dict:
+    return dict(
+        user=os.getenv('DB_USER', 'admin'),
+        password=os.getenv('DB_PASSWORD', 'quest'),
+        database=os.getenv('DB_NAME', 'qdb'),
+        host=os.getenv('DB_HOST', 'questdb'),
+        port=int(os.getenv('DB_PORT', 8812)),
+    )
+
+
+def pool_size_per_worker() -> int:
+    """
+    Split the connection budget between worker processes so that all workers together never exceed it.
+    :return: maximum pool size for this worker
+    """
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+    return max(1, DB_MAX_CONNECTIONS // workers)
 
 
 async def get_db_connection():
-    """Establish a connection to the database with retries."""
-    RETRIES = 5  # Maximum number of retries
-    while RETRIES > 0:
+    """
+    Wait for the database to accept connections, probing it with exponential backoff.
+    Each probe is bounded by ``DB_PROBE_TIMEOUT`` so an unreachable host fails fast instead of hanging on connect,
+    and the delay between probes doubles from ``DB_RETRY_INITIAL_DELAY`` up to ``DB_RETRY_MAX_DELAY``.
+    :return: a connection on which a trivial query succeeded
+    :raises: the last connection error once ``DB_CONNECT_DEADLINE`` seconds have passed
+    """
+    deadline = time.monotonic() + DB_CONNECT_DEADLINE
+    delay = DB_RETRY_INITIAL_DELAY
+    attempt = 1
+    while True:
         try:
-            logger.info(f"Attempting to connect to the database (retries left: {RETRIES})...")
-            connection = await asyncpg.connect(
-                user=os.getenv('DB_USER', 'admin'),
-                password=os.getenv('DB_PASSWORD', 'quest'),
-                database=os.getenv('DB_NAME', 'qdb'),
-                host=os.getenv('DB_HOST', 'questdb'),
-                port=int(os.getenv('DB_PORT', 8812)),
-            )
-            logger.info("Successfully connected to the database.")
-            return connection  # Return the connection if successful
+            connection = await asyncpg.connect(timeout=DB_PROBE_TIMEOUT, **_connection_kwargs())
+            try:
+                await connection.fetchval("SELECT 1", timeout=DB_PROBE_TIMEOUT)
+            except Exception:
+                await connection.close()
+                raise
+            logger.info(f"Successfully connected to the database (attempt {attempt}).")
+            return connection
         except Exception as e:
-            logger.error(f"Database connection failed: {e}")
-            RETRIES -= 1
-            if RETRIES == 0:
-                logger.error("All retry attempts failed. Giving up.")
-                raise  # Rethrow the exception after exhausting retries
-            await asyncio.sleep(5)  # Wait before retrying
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"Database still unreachable after {DB_CONNECT_DEADLINE:.0f} s, giving up: {e}")
+                raise
+            delay = min(delay, remaining)
+            logger.warning(f"Database not ready (attempt {attempt}): {e}, retrying in {delay:.2f} s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DB_RETRY_MAX_DELAY)
+            attempt += 1
+
+
+async def init_pool() -> asyncpg.Pool:
+    """
+    Create the connection pool of this worker.
+    The pool is created right away when the database is already up; the retry loop only kicks in after a failure,
+    which is detected within ``DB_PROBE_TIMEOUT`` seconds.
+    :return: the connection pool
+    """
+    global _pool
+    max_size = pool_size_per_worker()
+    try:
+        _pool = await asyncio.wait_for(
+            asyncpg.create_pool(min_size=1, max_size=max_size, **_connection_kwargs()), timeout=DB_PROBE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Database not reachable yet ({e}), waiting for it to come up...")
+        conn = await get_db_connection()
+        await conn.close()
+        _pool = await asyncpg.create_pool(min_size=1, max_size=max_size, **_connection_kwargs())
+
+    logger.info(f"Database connection pool ready (max size: {max_size}).")
+    return _pool
+
+
+def get_pool() -> asyncpg.Pool:
+    """Return the connection pool of this worker, created on startup by ``init_pool``."""
+    if _pool is None:
+        raise RuntimeError("Database connection pool is not initialized.")
+    return _pool
+
+
+@asynccontextmanager
+async def acquire():
+    """Acquire a connection from the pool, recording how long the wait took."""
+    pool = get_pool()
+    start = time.perf_counter()
+    with phase("acquire"):
+        conn = await pool.acquire()
+    DB_ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def close_pool():
+    """Close the connection pool, letting in-flight queries finish within ``DB_POOL_CLOSE_TIMEOUT`` seconds."""
+    global _pool
+    if _pool is None:
+        return
+
+    try:
+        await asyncio.wait_for(_pool.close(), timeout=DB_POOL_CLOSE_TIMEOUT)
+        logger.info("Database connection pool closed.")
+    except asyncio.TimeoutError:
+        logger.warning("Timed out waiting for in-flight queries, terminating database connections.")
+        _pool.terminate()
+    finally:
+        _pool = None
+
+
+@asynccontextmanager
+async def schema_lock():
+    """Hold ``SCHEMA_LOCK_FILE`` exclusively, waiting for the worker holding it to release it."""
+    if fcntl is None:
+        yield
+        return
+
+    fd = os.open(SCHEMA_LOCK_FILE, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
 
 
 async def init_db():
-    """Initialize the database and ensure the required table exists."""
-    conn = None
+    """Initialize the database, creating the required tables and migrating ``iot_data`` if it predates its schema."""
     try:
-        conn = await get_db_connection()  # Get the database connection
-        await conn.execute("""
-        CREATE TABLE IF NOT EXISTS iot_data (
-            timestamp TIMESTAMP,
-            device_id TEXT NOT NULL,
-            voltage DOUBLE NOT NULL,
-            current DOUBLE NOT NULL,
-            device_type TEXT NOT NULL,
-            location TEXT NOT NULL
-        )
-        """)
-        logger.info("Database initialized and 'iot_data' table ensured.")
+        async with schema_lock(), acquire() as conn:
+            await conn.execute(f"CREATE TABLE IF NOT EXISTS iot_data {IOT_DATA_SCHEMA}")
+            await migrate_legacy_table(conn)
+            # Window aggregates written by the stream processor, replayed windows overwrite their row
+            await conn.execute("""
+            CREATE TABLE IF NOT EXISTS iot_derived (
+                timestamp TIMESTAMP,
+                device_id SYMBOL,
+                window_size SYMBOL,
+                window_end TIMESTAMP,
+                readings LONG,
+                mean_voltage DOUBLE,
+                mean_current DOUBLE,
+                mean_power DOUBLE,
+                max_power DOUBLE,
+                energy_wh DOUBLE,
+                energy_total_wh DOUBLE
+            ) timestamp(timestamp) PARTITION BY DAY WAL
+            DEDUP UPSERT KEYS(timestamp, device_id, window_size)
+            """)
+        logger.info("Database initialized and 'iot_data' and 'iot_derived' tables ensured.")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
-    finally:
-        if conn:
-            await conn.close()
-            logger.info("Database connection closed.")
+
+
+async def migrate_legacy_table(conn) -> bool:
+    """
+    Rebuild ``iot_data`` when it was created without a designated timestamp or WAL, as by the first releases.
+    Dedup keys, partition retention, SAMPLE BY and LATEST ON all need both, so the rows are copied into a table
+    with the current schema, which then replaces the old one. The old table is kept as ``LEGACY_TABLE``.
+    :param conn: connection to the database
+    :return: True if the table was migrated
+    :raises: any error of the migration, the API must not start on a table it cannot deduplicate
+    """
+    table = await conn.fetchrow(
+        "SELECT designatedTimestamp, walEnabled FROM tables() WHERE table_name = 'iot_data'")
+    if table["designatedTimestamp"] and table["walEnabled"]:
+        # No-op when the keys are enabled already
+        await conn.execute("ALTER TABLE iot_data DEDUP ENABLE UPSERT KEYS(timestamp, device_id)")
+        return False
+
+    logger.warning(f"Table 'iot_data' has no designated timestamp or WAL, migrating it to the current schema "
+                   f"(the old table is kept as '{LEGACY_TABLE}').")
+    # Left over by an interrupted migration, the rows are copied again
+    await conn.execute(f"DROP TABLE IF EXISTS {MIGRATION_TABLE}")
+    await conn.execute(f"CREATE TABLE {MIGRATION_TABLE} {IOT_DATA_SCHEMA}")
+    # The designated timestamp cannot be null, such rows are only kept in the legacy table
+    await conn.execute(f"INSERT INTO {MIGRATION_TABLE} ({IOT_DATA_COLUMNS}) "
+                       f"SELECT {IOT_DATA_COLUMNS} FROM iot_data WHERE timestamp IS NOT NULL ORDER BY timestamp")
+    await conn.execute(f"RENAME TABLE iot_data TO {LEGACY_TABLE}")
+    await conn.execute(f"RENAME TABLE {MIGRATION_TABLE} TO iot_data")
+    logger.warning(f"Table 'iot_data' migrated, drop '{LEGACY_TABLE}' once the migrated data has been checked.")
+    return True
@@ -0,0 +1,48 @@
+import os
+from collections import OrderedDict
+from typing import Hashable
+
+# Number of recently ingested keys remembered by every worker
+INGEST_DEDUP_CAPACITY = int(os.getenv("INGEST_DEDUP_CAPACITY", 100000))
+
+
+class RecentKeys:
+    """
+    Bounded LRU set of recently seen keys. It filters replays on the hot path without a round trip to the
+    database, anything older than the last ``capacity`` keys is left to the QuestDB dedup keys.
+    """
+
+    def __init__(self, capacity: int = INGEST_DEDUP_CAPACITY):
+        self.capacity = capacity
+        self._keys: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def add(self, key: Hashable) -> bool:
+        """
+        Remember a key.
+        :param key: key of the ingested row
+        :return: True if the key was new, False if it had been seen already
+        """
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return False
+
+        self._keys[key] = None
+        if len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+        return True
+
+    def discard(self, key: Hashable):
+        """
+        Forget a key, e.g. because the row it identifies was never written.
+        :param key: key of the row
+        """
+        self._keys.pop(key, None)
+
+
+recent_keys = RecentKeys()
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+# from iot_analytics_project.api.db.db_connection import acquire
+from db.db_connection import acquire
+
+# Every worker only sees the readings it ingests itself, the map is merged with the database this often
+LATEST_RESYNC_INTERVAL_SECONDS = int(os.getenv("LATEST_RESYNC_INTERVAL_SECONDS", 30))
+# A failed resync is retried after this delay, doubled after every further failure up to the resync interval
+LATEST_RETRY_INITIAL_DELAY = float(os.getenv("LATEST_RETRY_INITIAL_DELAY", 1))
+
+LATEST_QUERY = """
+    SELECT timestamp, device_id, voltage, current, device_type, location
+    FROM iot_data
+    LATEST ON timestamp PARTITION BY device_id
+"""
+
+COLUMNS = ("timestamp", "device_id", "voltage", "current", "device_type", "location")
+
+
+class LatestReadings:
+    """
+    Latest reading of every device, kept in memory so current-state lookups do not scan the table.
+    Updated by the ingest path and merged periodically with the latest rows in QuestDB, which are
+    also used to fill the map on a cold start. While the database cannot be read the map is still served,
+    flagged as stale, and the resync is retried with backoff.
+    """
+
+    def __init__(self, resync_interval_seconds: int = LATEST_RESYNC_INTERVAL_SECONDS):
+        self.resync_interval = resync_interval_seconds
+        self._readings: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        # time.monotonic() of the last successful resync, None until the map has been filled from the database
+        self.synced_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._readings)
+
+    @property
+    def synced(self) -> bool:
+        """Whether the map has been filled from the database at least once."""
+        return self.synced_at is not None
+
+    @property
+    def stale(self) -> bool:
+        """Whether readings ingested by other workers may be missing: no resync succeeded for two intervals."""
+        return self.synced_at is None or time.monotonic() - self.synced_at > 2 * self.resync_interval
+
+    def update(self, reading: dict):
+        """
+        Keep a reading if it is newer than the one known for its device.
+        :param reading: reading with the columns of ``COLUMNS``
+        """
+        current = self._readings.get(reading["device_id"])
+        if current is None or reading["timestamp"] >= current["timestamp"]:
+            self._readings[reading["device_id"]] = reading
+
+    def update_row(self, row: tuple):
+        """
+        Keep an ingested row if it is newer than the reading known for its device.
+        :param row: values in the order of ``COLUMNS``
+        """
+        self.update(dict(zip(COLUMNS, row)))
+
+    def merge(self, readings: Iterable[dict]):
+        """Merge readings from the database, without replacing newer ones that are still being written."""
+        for reading in readings:
+            self.update(reading)
+
+    def snapshot(self) -> List[dict]:
+        """The latest reading of every known device."""
+        return list(self._readings.values())
+
+    async def resync(self):
+        """Merge the latest row of every device stored in QuestDB into the map."""
+        async with acquire() as conn:
+            records = await conn.fetch(LATEST_QUERY)
+        self.merge(dict(record) for record in records)
+        self.synced_at = time.monotonic()
+
+    async def start(self):
+        """Fill the map from the database and start the periodic resync task."""
+        try:
+            await self.resync()
+        except Exception as e:
+            logger.error(f"Loading the latest readings failed: {e}")
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Latest readings loaded for {len(self)} devices (resync every {self.resync_interval} s).")
+
+    async def stop(self):
+        """Cancel the periodic resync task."""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        delay = self.resync_interval if self.synced else LATEST_RETRY_INITIAL_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.resync()
+                delay = self.resync_interval
+            except Exception as e:
+                delay = (LATEST_RETRY_INITIAL_DELAY if delay >= self.resync_interval
+                         else min(delay * 2, self.resync_interval))
+                logger.error(f"Resyncing the latest readings failed, retrying in {delay:.0f} s: {e}")
+
+
+latest_readings = LatestReadings()
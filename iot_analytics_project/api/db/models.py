@@ -1,25 +1,39 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from datetime import datetime, timezone
 from typing import Optional
 
 
 class IoTData(BaseModel):
-    timestamp: Optional[datetime] = Field(default=None, description="The timestamp when the data was recorded.")
-    device_id: str = Field(..., description="The unique identifier for the IoT device.")
-    voltage: float = Field(..., description="The voltage recorded by the device.")
-    current: float = Field(..., description="The current recorded by the device.")
-    device_type: str = Field(..., description="The type of IoT device.")
-    location: str = Field(..., description="The location where the data was recorded.")
-
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "timestamp": "2025-01-01T12:34:56",
                 "device_id": "4c118ca0-d470-4440-9a87-aff5f61bb138",
                 "voltage": 3.7,
                 "current": 0.5,
                 "device_type": "Controller",
-                "location": "warehouse"
+                "location": "warehouse",
+                "message_id": "machinery-data-0-42"
             }
         }
+    )
+
+    timestamp: Optional[datetime] = Field(default=None, description="The timestamp when the data was recorded.")
+    device_id: str = Field(..., description="The unique identifier for the IoT device.")
+    voltage: float = Field(..., description="The voltage recorded by the device.")
+    current: float = Field(..., description="The current recorded by the device.")
+    device_type: str = Field(..., description="The type of IoT device.")
+    location: str = Field(..., description="The location where the data was recorded.")
+    message_id: Optional[str] = Field(default=None, description="Identifier of the source message, "
+                                                                "used to drop replayed messages.")
+
+
+# Built once at import time, validates raw request bytes without going through ``json.loads`` first
+IOT_DATA_ADAPTER = TypeAdapter(IoTData)
+
 
+def to_utc_naive(value: datetime) -> datetime:
+    """Timestamps are stored as naive UTC, convert aware datetimes accordingly."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import tempfile
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the API only runs as a single development process
+    fcntl = None
+
+from loguru import logger
+# from iot_analytics_project.api.db.db_connection import acquire
+from db.db_connection import acquire
+
+# Days of raw readings kept, older partitions are dropped. 0 disables retention for raw data.
+RAW_DATA_TTL_DAYS = int(os.getenv("RAW_DATA_TTL_DAYS", 30))
+# Days kept for tables holding aggregated data, these are much smaller and are kept longer
+AGGREGATE_DATA_TTL_DAYS = int(os.getenv("AGGREGATE_DATA_TTL_DAYS", 365))
+# Comma separated list of aggregate tables the longer TTL applies to
+AGGREGATE_TABLES = [table for table in os.getenv("AGGREGATE_TABLES", "iot_derived").split(",") if table]
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", 3600))
+# Held by the one worker process applying retention, the other workers of the API skip the scheduled runs
+RETENTION_LOCK_FILE = os.getenv("RETENTION_LOCK_FILE", os.path.join(tempfile.gettempdir(), "iot-api-retention.lock"))
+# Error raised by QuestDB when no partition is old enough to be dropped, the common case between runs
+NO_MATCHING_PARTITION = "no partitions matched"
+
+RAW_TABLES = ["iot_data"]
+
+
+def retention_policies() -> Dict[str, int]:
+    """
+    TTL in days of every table under retention.
+    :return: mapping of table name to TTL
+    """
+    policies = {table: RAW_DATA_TTL_DAYS for table in RAW_TABLES}
+    policies.update({table: AGGREGATE_DATA_TTL_DAYS for table in AGGREGATE_TABLES})
+    return policies
+
+
+async def apply_retention() -> Dict[str, str]:
+    """
+    Drop every partition that is entirely older than the TTL of its table.
+    Whole partitions are dropped, which only removes files instead of rewriting the table.
+    :return: outcome per table
+    """
+    results = {}
+    async with acquire() as conn:
+        for table, ttl_days in retention_policies().items():
+            if ttl_days <= 0:
+                results[table] = "disabled"
+                continue
+
+            try:
+                await conn.execute(
+                    f"ALTER TABLE {table} DROP PARTITION WHERE timestamp < dateadd('d', -{ttl_days}, now())"
+                )
+                results[table] = f"dropped partitions older than {ttl_days} days"
+            except Exception as e:
+                if NO_MATCHING_PARTITION in str(e).lower():
+                    results[table] = "nothing to drop"
+                else:
+                    logger.error(f"Dropping partitions of '{table}' failed: {e}")
+                    results[table] = f"failed: {e}"
+
+    logger.info(f"Retention applied: {results}")
+    return results
+
+
+async def storage_report() -> Dict[str, dict]:
+    """
+    Size of every table under retention, per partition.
+    :return: mapping of table name to its TTL, totals and partitions
+    """
+    report = {}
+    async with acquire() as conn:
+        for table, ttl_days in retention_policies().items():
+            try:
+                partitions = [dict(record) for record in await conn.fetch(f"SELECT * FROM table_partitions('{table}')")]
+            except Exception as e:
+                report[table] = {"ttl_days": ttl_days, "error": str(e)}
+                continue
+
+            report[table] = {
+                "ttl_days": ttl_days,
+                "rows": sum(partition.get("numRows") or 0 for partition in partitions),
+                "disk_size": sum(partition.get("diskSize") or 0 for partition in partitions),
+                "partitions": partitions,
+            }
+    return report
+
+
+class RetentionManager:
+    """
+    Applies the retention policies periodically from a background task.
+
+    Every worker process of the API starts one, but only the worker holding an exclusive lock on ``lock_file``
+    applies them. The others try to take the lock before each run, so one of them takes over when the worker
+    holding it exits.
+    """
+
+    def __init__(self, interval_seconds: int = RETENTION_INTERVAL_SECONDS, lock_file: str = RETENTION_LOCK_FILE):
+        self.interval = interval_seconds
+        self.lock_file = lock_file
+        self._task: Optional[asyncio.Task] = None
+        self._lock_fd: Optional[int] = None
+
+    def _is_leader(self) -> bool:
+        """Take the retention lock unless this process holds it already, without waiting for it."""
+        if self._lock_fd is not None or fcntl is None:
+            return True
+
+        fd = os.open(self.lock_file, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        self._lock_fd = fd
+        logger.info(f"This worker (pid {os.getpid()}) applies the retention policies.")
+        return True
+
+    async def start(self):
+        """Start the background retention task."""
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Retention manager started (every {self.interval} s, policies: {retention_policies()}).")
+
+    async def stop(self):
+        """Cancel the background retention task."""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self._is_leader():
+                    await apply_retention()
+            except Exception as e:
+                logger.error(f"Applying retention failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+retention_manager = RetentionManager()
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+from loguru import logger
+# from iot_analytics_project.api.db.db_connection import acquire
+# from iot_analytics_project.api.instrumentation import FLUSH_BATCH_ROWS, FLUSH_SECONDS, ROWS_DROPPED, ROWS_INSERTED, WRITE_BUFFER_ROWS
+from db.db_connection import acquire
+from instrumentation import FLUSH_BATCH_ROWS, FLUSH_SECONDS, ROWS_DROPPED, ROWS_INSERTED, WRITE_BUFFER_ROWS
+
+# Flush whichever comes first: INGEST_FLUSH_INTERVAL_MS elapsed or INGEST_FLUSH_MAX_ROWS rows waiting
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", 250))
+INGEST_FLUSH_MAX_ROWS = int(os.getenv("INGEST_FLUSH_MAX_ROWS", 1000))
+# Upper bound of rows held in memory, new rows are rejected once it is reached
+INGEST_BUFFER_MAX_ROWS = int(os.getenv("INGEST_BUFFER_MAX_ROWS", 50000))
+INGEST_FLUSH_RETRIES = int(os.getenv("INGEST_FLUSH_RETRIES", 3))
+
+INSERT_QUERY = """
+    INSERT INTO iot_data(timestamp, device_id, voltage, current, device_type, location)
+    VALUES($1, $2, $3, $4, $5, $6)
+"""
+
+Row = Tuple
+
+
+class BufferFullError(Exception):
+    """Raised when the buffer already holds ``max_rows`` rows."""
+
+
+class WriteBehindBuffer:
+    """
+    Collects single rows in memory and writes them to QuestDB in bulk from a background task.
+    """
+
+    def __init__(self, flush_interval_ms: int = INGEST_FLUSH_INTERVAL_MS,
+                 flush_max_rows: int = INGEST_FLUSH_MAX_ROWS,
+                 max_rows: int = INGEST_BUFFER_MAX_ROWS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_rows = flush_max_rows
+        self.max_rows = max_rows
+        self._rows: Deque[Row] = deque()
+        # Created in start() so they belong to the event loop of the worker
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._flush_listeners: List[Callable[[List[Row]], None]] = []
+        self._drop_listeners: List[Callable[[List[Row]], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def put(self, row: Row):
+        """
+        Enqueue a row for the next flush.
+        :param row: values in the column order of ``INSERT_QUERY``
+        :raises BufferFullError: when the buffer is at capacity
+        """
+        if len(self._rows) >= self.max_rows:
+            raise BufferFullError(f"Write buffer is full ({self.max_rows} rows).")
+
+        self._rows.append(row)
+        # Before start() rows just accumulate, the first flush picks them up
+        if len(self._rows) >= self.flush_max_rows and self._wakeup is not None:
+            self._wakeup.set()
+
+    def add_flush_listener(self, listener: Callable[[List[Row]], None]):
+        """
+        Register a function called with every batch once it has been written.
+        :param listener: function taking the list of written rows
+        """
+        self._flush_listeners.append(listener)
+
+    def add_drop_listener(self, listener: Callable[[List[Row]], None]):
+        """
+        Register a function called with every batch given up after ``INGEST_FLUSH_RETRIES`` failed attempts.
+        :param listener: function taking the list of dropped rows
+        """
+        self._drop_listeners.append(listener)
+
+    async def start(self):
+        """Start the background flush task."""
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Write buffer started (flush every {self.flush_interval * 1000:.0f} ms "
+                    f"or {self.flush_max_rows} rows, capacity {self.max_rows} rows).")
+
+    async def stop(self):
+        """Stop the background task and flush everything still buffered."""
+        if self._task is None:
+            return
+
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        logger.info("Write buffer stopped and flushed.")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+        await self.flush()
+
+    async def flush(self):
+        """Write all buffered rows, in batches of at most ``flush_max_rows``."""
+        while self._rows:
+            batch: List[Row] = [self._rows.popleft() for _ in range(min(self.flush_max_rows, len(self._rows)))]
+            await self._write(batch)
+
+    async def _write(self, batch: List[Row]):
+        for attempt in range(1, INGEST_FLUSH_RETRIES + 1):
+            try:
+                start = time.perf_counter()
+                async with acquire() as conn:
+                    await conn.executemany(INSERT_QUERY, batch)
+                FLUSH_SECONDS.observe(time.perf_counter() - start)
+                FLUSH_BATCH_ROWS.observe(len(batch))
+                ROWS_INSERTED.inc(len(batch))
+                logger.debug("Flushed {} rows.", len(batch))
+            except Exception as e:
+                logger.error(f"Flushing {len(batch)} rows failed (attempt {attempt}/{INGEST_FLUSH_RETRIES}): {e}")
+                if attempt < INGEST_FLUSH_RETRIES:
+                    await asyncio.sleep(self.flush_interval * attempt)
+                continue
+
+            self._notify(self._flush_listeners, batch)
+            return
+
+        ROWS_DROPPED.inc(len(batch))
+        logger.error(f"Dropping {len(batch)} rows after {INGEST_FLUSH_RETRIES} failed flush attempts.")
+        self._notify(self._drop_listeners, batch)
+
+    @staticmethod
+    def _notify(listeners: List[Callable[[List[Row]], None]], batch: List[Row]):
+        # A failing listener must not take down the flush task, the buffer would never drain again
+        for listener in listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                logger.exception(f"Write buffer listener {getattr(listener, '__qualname__', listener)} failed: {e}")
+
+
+write_buffer = WriteBehindBuffer()
+WRITE_BUFFER_ROWS.set_function(lambda: len(write_buffer))
@@ -0,0 +1,53 @@
+import time
+# from iot_analytics_project.common.metrics import Counter, Gauge, Histogram
+from common.metrics import Counter, Gauge, Histogram
+
+REQUEST_SECONDS = Histogram("api_request_seconds", "Latency of API requests by route.",
+                            ["method", "route", "status"])
+DB_ACQUIRE_SECONDS = Histogram("api_db_acquire_seconds", "Time spent waiting for a connection from the pool.")
+
+ROWS_ACCEPTED = Counter("api_rows_accepted", "Readings accepted into the write buffer.")
+ROWS_REJECTED = Counter("api_rows_rejected", "Readings rejected with a 429 because the write buffer was full.")
+ROWS_DUPLICATE = Counter("api_rows_duplicate", "Replayed readings acknowledged without being written again.")
+ROWS_INSERTED = Counter("api_rows_inserted", "Rows written to QuestDB by the write buffer.")
+ROWS_DROPPED = Counter("api_rows_dropped", "Rows dropped after every flush attempt failed.")
+WRITE_BUFFER_ROWS = Gauge("api_write_buffer_rows", "Rows waiting in the write buffer.")
+FLUSH_SECONDS = Histogram("api_flush_seconds", "Time spent writing one batch of buffered rows.")
+FLUSH_BATCH_ROWS = Histogram("api_flush_batch_rows", "Rows written per flush.",
+                             buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+CACHE_HITS = Counter("api_cache_hits", "Responses served from the result cache by route.", ["route"])
+CACHE_MISSES = Counter("api_cache_misses", "Responses not found in the result cache by route.", ["route"])
+CACHE_EVICTIONS = Counter("api_cache_evictions", "Result cache entries removed by reason.", ["reason"])
+CACHE_BYTES = Gauge("api_cache_bytes", "Size of the responses held by the result cache.")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every request, labelled with the route template
+    (e.g. ``/data/{device_id}``) rather than the raw path so the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(scope["method"], route.path if route else "unmatched", status).observe(
+                time.perf_counter() - start
+            )
@@ -1,27 +1,87 @@
+import os
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 import uvicorn
-# from iot_analytics_project.api.db.db_connection import init_db
-# from iot_analytics_project.api.routes import endpoints
+# from iot_analytics_project.api.db.db_connection import init_db, init_pool, close_pool
+# from iot_analytics_project.api.db.latest import latest_readings
+# from iot_analytics_project.api.db.retention import retention_manager
+# from iot_analytics_project.api.db.write_buffer import write_buffer
+# from iot_analytics_project.api.instrumentation import MetricsMiddleware
+# from iot_analytics_project.api.profiling import ProfilingMiddleware
+# from iot_analytics_project.api.routes import admin, aggregates, endpoints
+# from iot_analytics_project.common.log import configure_logging
+# from iot_analytics_project.common.metrics import CONTENT_TYPE, REGISTRY
 
-from db.db_connection import init_db
-from routes import endpoints
+from db.db_connection import init_db, init_pool, close_pool
+from db.latest import latest_readings
+from db.retention import retention_manager
+from db.write_buffer import write_buffer
+from instrumentation import MetricsMiddleware
+from profiling import ProfilingMiddleware
+from routes import admin, aggregates, endpoints
+from common.log import configure_logging
+from common.metrics import CONTENT_TYPE, REGISTRY
 
-app = FastAPI()
+# "development" runs a single auto-reloading process, "production" runs multiple workers on uvloop/httptools
+API_MODE = os.getenv("API_MODE", "development")
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", 8000))
+# Seconds uvicorn waits for in-flight requests to finish once shutdown is requested
+GRACEFUL_SHUTDOWN_TIMEOUT = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", 30))
+
+app = FastAPI(default_response_class=ORJSONResponse)
 app.include_router(endpoints.router)
+app.include_router(aggregates.router)
+app.include_router(admin.router)
+app.add_middleware(MetricsMiddleware)
+# Opt-in per request with the X-Profile header or sampled with PROFILE_SAMPLE_RATE, see profiling.py
+app.add_middleware(ProfilingMiddleware)
 
 @app.get("/")
 def read_root():
     return {"message": "API is running"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Metrics of the worker that answered, in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.on_event("startup")
 async def startup_event():
     """Run tasks needed before the application starts serving requests."""
+    configure_logging()
+    await init_pool()
     await init_db()
+    await latest_readings.start()
+    await write_buffer.start()
+    await retention_manager.start()
+
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release resources once uvicorn has stopped accepting requests and drained the in-flight ones."""
+    await retention_manager.stop()
+    await write_buffer.stop()
+    await latest_readings.stop()
+    await close_pool()
 
 
+def run():
+    """Serve the API according to ``API_MODE``."""
+    if API_MODE == "production":
+        workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+        # Exported so every worker process can size its connection pool to its share of the database
+        os.environ["WEB_CONCURRENCY"] = str(workers)
+        uvicorn.run("main:app", host=API_HOST, port=API_PORT,
+                    workers=workers,
+                    loop="uvloop",
+                    http="httptools",
+                    access_log=False,
+                    timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT)
+    else:
+        #uvicorn.run("iot_analytics_project.api.main:app", host="127.0.0.1", port=8000, reload=True)
+        uvicorn.run("main:app", host=API_HOST, port=API_PORT, reload=True)
 
 
 if __name__ == "__main__":
-    #uvicorn.run("iot_analytics_project.api.main:app", host="127.0.0.1", port=8000, reload=True)
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    run()
@@ -0,0 +1,151 @@
+import cProfile
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional
+
+from loguru import logger
+from starlette.datastructures import MutableHeaders
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # pyinstrument is optional, cProfile is used without it
+    Profiler = None
+
+# Requests carrying this header with any value but "0" are profiled
+PROFILE_HEADER = b"x-profile"
+# Fraction of the remaining requests profiled at random, 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+# Profiled requests slower than this many milliseconds get their profile written to PROFILE_DUMP_DIR
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 500))
+# Directory for the profiles of slow requests, nothing is written when unset
+PROFILE_DUMP_DIR = os.getenv("PROFILE_DUMP_DIR")
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("profile_timings", default=None)
+# Only one profiler may be active in the process at a time
+_profiler_busy = False
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a phase of the current request, e.g. ``with phase("query"): ...``.
+    Costs a single context variable lookup when the request is not profiled.
+    :param name: name of the phase in the Server-Timing header
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    """
+    Format phase timings as a Server-Timing header value, in milliseconds.
+    :param timings: seconds spent per phase
+    :param total: seconds spent on the whole request
+    :return: the header value
+    """
+    entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries)
+
+
+class _RequestProfiler:
+    """Profiles a request with pyinstrument when installed, with cProfile otherwise."""
+
+    def __init__(self):
+        if Profiler is not None:
+            self._profiler = Profiler(async_mode="enabled")
+        else:
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if Profiler is not None:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if Profiler is not None:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def dump(self, scope, total: float):
+        os.makedirs(PROFILE_DUMP_DIR, exist_ok=True)
+        name = (f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{scope['method']}"
+                f"{scope['path'].replace('/', '_')}_{total * 1000:.0f}ms")
+
+        if Profiler is not None:
+            path = os.path.join(PROFILE_DUMP_DIR, f"{name}.html")
+            with open(path, "w") as f:
+                f.write(self._profiler.output_html())
+        else:
+            path = os.path.join(PROFILE_DUMP_DIR, f"{name}.prof")
+            self._profiler.dump_stats(path)
+        logger.warning(f"Slow request {scope['method']} {scope['path']} took {total * 1000:.0f} ms, "
+                       f"profile written to {path}")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware timing the phases of opted-in requests (``X-Profile: 1`` header, or sampled at
+    ``PROFILE_SAMPLE_RATE``) and returning them in a ``Server-Timing`` header. When ``PROFILE_DUMP_DIR`` is set,
+    opted-in requests are also run under a profiler and slow ones get their profile written there.
+    Note that the profiler sees every coroutine running on the event loop meanwhile, not only the profiled request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        for key, value in scope["headers"]:
+            if key == PROFILE_HEADER:
+                return value not in (b"0", b"false")
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        global _profiler_busy
+
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+
+        profiler = None
+        if PROFILE_DUMP_DIR and not _profiler_busy:
+            _profiler_busy = True
+            profiler = _RequestProfiler()
+            profiler.start()
+
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing(timings, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            total = time.perf_counter() - start
+            _timings.reset(token)
+            if profiler is not None:
+                profiler.stop()
+                _profiler_busy = False
+                if total * 1000 >= PROFILE_SLOW_MS:
+                    profiler.dump(scope, total)
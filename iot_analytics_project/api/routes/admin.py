@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
+# from iot_analytics_project.api.db.retention import apply_retention, storage_report
+from db.retention import apply_retention, storage_report
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/storage")
+async def get_storage():
+    """
+    Report rows and disk size of every table under retention, with a breakdown per partition.
+    """
+    try:
+        report = await storage_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return ORJSONResponse(report)
+
+
+@router.post("/retention")
+async def run_retention():
+    """
+    Apply the retention policies right away instead of waiting for the next scheduled run.
+    """
+    try:
+        results = await apply_retention()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return ORJSONResponse(results)
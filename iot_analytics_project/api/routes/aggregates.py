@@ -0,0 +1,176 @@
+import os
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import List, Optional
+import orjson
+from fastapi import APIRouter, HTTPException, Query
+# from iot_analytics_project.api.db.db_connection import acquire
+# from iot_analytics_project.api.db.models import to_utc_naive
+# from iot_analytics_project.api.profiling import phase
+# from iot_analytics_project.api.routes.cache import cached_response, result_cache
+from db.db_connection import acquire
+from db.models import to_utc_naive
+from profiling import phase
+from routes.cache import cached_response, result_cache
+
+router = APIRouter()
+
+# A window is closed, and its result cached for the longer TTL, once its end is this many seconds in the past.
+# Leaves time for buffered rows to be flushed and applied by QuestDB.
+AGGREGATE_CLOSED_AFTER_SECONDS = int(os.getenv("AGGREGATE_CLOSED_AFTER_SECONDS", 60))
+# A default end (now) is rounded up to a multiple of this, so that repeated default requests share a cache entry
+AGGREGATE_DEFAULT_END_ROUNDING_SECONDS = int(os.getenv("AGGREGATE_DEFAULT_END_ROUNDING_SECONDS", 10))
+
+
+class GroupByOptions(str, Enum):
+    device_type = "device_type"
+    location = "location"
+
+
+def default_end(now: datetime, rounding_seconds: int = AGGREGATE_DEFAULT_END_ROUNDING_SECONDS) -> datetime:
+    """
+    End of the window when the request does not set one: now, rounded up to a multiple of ``rounding_seconds``.
+    Rounding up extends the window by a few seconds at most, and keeps the cache key stable between requests.
+    """
+    epoch = datetime(1970, 1, 1)
+    seconds = -(-(now - epoch) // timedelta(seconds=rounding_seconds)) * rounding_seconds
+    return epoch + timedelta(seconds=seconds)
+
+
+def build_aggregate_query(group_by: List[GroupByOptions], bucket: Optional[str]) -> str:
+    """
+    Build the aggregation query, run entirely by QuestDB.
+    Columns listed next to the aggregates become grouping keys, SAMPLE BY adds the time buckets.
+    :param group_by: columns to group by
+    :param bucket: size of the time buckets, e.g. 15m, 1h or 1d, None for a single bucket spanning the window
+    :return: the query, taking the start and end of the window as parameters
+    """
+    keys = [column.value for column in group_by]
+    if bucket:
+        keys.insert(0, "timestamp")
+
+    columns = ", ".join(keys + [
+        "count() AS readings",
+        "avg(voltage) AS mean_voltage",
+        "avg(current) AS mean_current",
+        "avg(voltage * current) AS mean_power",
+        "max(voltage * current) AS max_power",
+    ])
+    query = f"SELECT {columns} FROM iot_data WHERE timestamp >= $1 AND timestamp < $2"
+    if bucket:
+        query += f" SAMPLE BY {bucket} ALIGN TO CALENDAR"
+    return query
+
+
+@router.get("/aggregates")
+async def get_aggregates(group_by: List[GroupByOptions] = Query(default=[]),
+                         bucket: Optional[str] = Query(default=None, pattern=r"^\d+[smhd]$"),
+                         start: Optional[datetime] = Query(default=None),
+                         end: Optional[datetime] = Query(default=None)):
+    """
+    Fleet-wide statistics grouped by device type and/or location, optionally per time bucket.
+
+    Query Parameters:
+    - group_by: device_type and/or location, repeat the parameter to group by both.
+    - bucket: size of the time buckets, e.g. 15m, 1h or 1d (default: one bucket for the whole window).
+    - start: beginning of the window (default: 24 hours before end).
+    - end: end of the window, exclusive (default: now).
+
+    Returns:
+    - Readings count, mean voltage, mean current, mean and max power per group. A sum of power samples depends
+      on the sampling rate rather than on the consumption, energy in Wh is integrated per device under /derived.
+      Results are cached for a few seconds, for minutes when the window ended more than a minute ago.
+    """
+    now = datetime.utcnow()
+    end = to_utc_naive(end) if end else default_end(now)
+    start = to_utc_naive(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=422, detail="start must be before end")
+
+    group_by = sorted(set(group_by), key=lambda column: column.value)
+    key = (tuple(column.value for column in group_by), bucket, start, end)
+    closed = end <= now - timedelta(seconds=AGGREGATE_CLOSED_AFTER_SECONDS)
+
+    body = result_cache.get("aggregates", key)
+    if body is not None:
+        return cached_response(body)
+
+    query = build_aggregate_query(group_by, bucket)
+    try:
+        async with acquire() as conn:
+            with phase("query"):
+                result = await conn.fetch(query, start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    with phase("serialize"):
+        body = orjson.dumps({
+            "group_by": list(key[0]),
+            "bucket": bucket,
+            "start": start,
+            "end": end,
+            "data": [dict(record) for record in result],
+        })
+
+    result_cache.put("aggregates", key, body, window=(start, end), closed=closed)
+    return cached_response(body)
+
+
+DERIVED_QUERY = """
+SELECT timestamp AS window_start, window_end, readings, mean_voltage, mean_current, mean_power, max_power,
+       energy_wh, energy_total_wh
+FROM iot_derived
+WHERE device_id = $1 AND window_size = $2 AND timestamp >= $3 AND timestamp < $4
+ORDER BY timestamp
+"""
+
+
+@router.get("/derived/{device_id}")
+async def get_derived(device_id: str,
+                      window: str = Query(default="1h"),
+                      start: Optional[datetime] = Query(default=None),
+                      end: Optional[datetime] = Query(default=None)):
+    """
+    Window aggregates of a device, precomputed by the stream processor.
+
+    Path Parameters:
+    - device_id: ID of the device.
+
+    Query Parameters:
+    - window: window the aggregates were computed over, e.g. 1h for tumbling or 24h/6h for hopping windows.
+    - start: windows starting at or after this time (default: 7 days before end).
+    - end: windows starting before this time (default: now).
+
+    Returns:
+    - Readings count, mean voltage, mean current, mean and max power, energy over the window and
+      total energy of the device (Wh) per window.
+    """
+    end = to_utc_naive(end) if end else default_end(datetime.utcnow())
+    start = to_utc_naive(start) if start else end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=422, detail="start must be before end")
+
+    # Rows are written by the stream processor rather than the write buffer, so entries only expire by TTL
+    key = (device_id, window, start, end)
+    body = result_cache.get("derived", key)
+    if body is not None:
+        return cached_response(body)
+
+    try:
+        async with acquire() as conn:
+            with phase("query"):
+                result = await conn.fetch(DERIVED_QUERY, device_id, window, start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    with phase("serialize"):
+        body = orjson.dumps({
+            "device_id": device_id,
+            "window": window,
+            "start": start,
+            "end": end,
+            "data": [dict(record) for record in result],
+        })
+
+    result_cache.put("derived", key, body, device_id=device_id)
+    return cached_response(body)
@@ -0,0 +1,170 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Hashable, List, NamedTuple, Optional, Set, Tuple
+from fastapi.responses import Response
+# from iot_analytics_project.api.db.write_buffer import write_buffer
+# from iot_analytics_project.api.instrumentation import CACHE_BYTES, CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+from db.write_buffer import write_buffer
+from instrumentation import CACHE_BYTES, CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+# Total size of the cached response bodies per worker, least recently used entries are evicted beyond it
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Lifetime of results that may still change, i.e. not restricted to a time window that has closed
+RESULT_CACHE_OPEN_TTL_SECONDS = float(os.getenv("RESULT_CACHE_OPEN_TTL_SECONDS", 5))
+# Lifetime of results over closed time windows. These still change when readings reach the database without going
+# through the write buffer of this worker (other workers, bulk imports, late or replayed readings), or when QuestDB
+# applies a batch after the query that followed its invalidation, so they are not kept forever either
+RESULT_CACHE_CLOSED_TTL_SECONDS = float(os.getenv("RESULT_CACHE_CLOSED_TTL_SECONDS", 600))
+
+Window = Tuple[datetime, datetime]
+
+
+class _Entry(NamedTuple):
+    body: bytes
+    # Device the result is restricted to, None when it covers the whole fleet
+    device_id: Optional[str]
+    # [start, end) of the readings the result covers, None when unbounded
+    window: Optional[Window]
+    # time.monotonic() after which the entry is stale
+    expires_at: float
+
+
+class ResultCache:
+    """
+    LRU cache of serialized responses, bounded by the size of the bodies.
+
+    Results over closed time windows expire after ``closed_ttl_seconds``, the others after ``open_ttl_seconds``.
+    Every batch written by the write buffer invalidates the entries it affects: those of the devices in the
+    batch, or of the whole fleet, whose window contains one of the written timestamps. Each worker only sees
+    its own writes, so results changed by anything else (another worker, a bulk import) are only refreshed
+    once their TTL has passed: within ``open_ttl_seconds`` for open windows, ``closed_ttl_seconds`` for closed ones.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 open_ttl_seconds: float = RESULT_CACHE_OPEN_TTL_SECONDS,
+                 closed_ttl_seconds: float = RESULT_CACHE_CLOSED_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.open_ttl = open_ttl_seconds
+        self.closed_ttl = closed_ttl_seconds
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._by_device: Dict[str, Set[Hashable]] = {}
+        self._fleet: Set[Hashable] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, route: str, key: Hashable) -> Optional[bytes]:
+        """
+        Look up a response.
+        :param route: name of the route, also used as metrics label
+        :param key: normalized query parameters
+        :return: the response body, None on a miss
+        """
+        entry = self._entries.get((route, key))
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove((route, key), "expired")
+            entry = None
+
+        if entry is None:
+            CACHE_MISSES.labels(route).inc()
+            return None
+
+        self._entries.move_to_end((route, key))
+        CACHE_HITS.labels(route).inc()
+        return entry.body
+
+    def put(self, route: str, key: Hashable, body: bytes, device_id: Optional[str] = None,
+            window: Optional[Window] = None, closed: bool = False):
+        """
+        Store a response.
+        :param route: name of the route
+        :param key: normalized query parameters
+        :param body: serialized response
+        :param device_id: device the result is restricted to, None for fleet-wide results
+        :param window: [start, end) of the readings covered, None when unbounded
+        :param closed: whether no more readings are expected in ``window``, keeping the entry for the longer TTL
+        """
+        if len(body) > self.max_bytes:
+            return
+
+        cache_key = (route, key)
+        if cache_key in self._entries:
+            self._remove(cache_key, "replaced")
+
+        expires_at = time.monotonic() + (self.closed_ttl if closed else self.open_ttl)
+        self._entries[cache_key] = _Entry(body, device_id, window, expires_at)
+        self.size += len(body)
+        if device_id is None:
+            self._fleet.add(cache_key)
+        else:
+            self._by_device.setdefault(device_id, set()).add(cache_key)
+
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)), "size")
+
+    def invalidate(self, rows: List[tuple]):
+        """
+        Drop the entries affected by written rows, registered as a flush listener of the write buffer.
+        :param rows: written rows, starting with timestamp and device_id
+        """
+        bounds: Dict[str, List[datetime]] = {}
+        for timestamp, device_id, *_ in rows:
+            device_bounds = bounds.get(device_id)
+            if device_bounds is None:
+                bounds[device_id] = [timestamp, timestamp]
+            elif timestamp < device_bounds[0]:
+                device_bounds[0] = timestamp
+            elif timestamp > device_bounds[1]:
+                device_bounds[1] = timestamp
+
+        if not bounds:
+            return
+
+        stale = set()
+        for device_id, (first, last) in bounds.items():
+            for cache_key in self._by_device.get(device_id, ()):
+                if self._overlaps(self._entries[cache_key].window, first, last):
+                    stale.add(cache_key)
+
+        first = min(first for first, _ in bounds.values())
+        last = max(last for _, last in bounds.values())
+        for cache_key in self._fleet:
+            if self._overlaps(self._entries[cache_key].window, first, last):
+                stale.add(cache_key)
+
+        for cache_key in stale:
+            self._remove(cache_key, "invalidated")
+
+    def clear(self):
+        """Drop every entry."""
+        for cache_key in list(self._entries):
+            self._remove(cache_key, "cleared")
+
+    @staticmethod
+    def _overlaps(window: Optional[Window], first: datetime, last: datetime) -> bool:
+        return window is None or (window[0] <= last and first < window[1])
+
+    def _remove(self, cache_key: Hashable, reason: str):
+        entry = self._entries.pop(cache_key)
+        self.size -= len(entry.body)
+        if entry.device_id is None:
+            self._fleet.discard(cache_key)
+        else:
+            keys = self._by_device[entry.device_id]
+            keys.discard(cache_key)
+            if not keys:
+                del self._by_device[entry.device_id]
+        CACHE_EVICTIONS.labels(reason).inc()
+
+
+def cached_response(body: bytes) -> Response:
+    """Response for a body taken from the cache, already serialized as JSON."""
+    return Response(body, media_type="application/json")
+
+
+result_cache = ResultCache()
+write_buffer.add_flush_listener(result_cache.invalidate)
+CACHE_BYTES.set_function(lambda: result_cache.size)
@@ -1,10 +1,25 @@
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Query
-# from iot_analytics_project.api.db.db_connection import get_db_connection
-# from iot_analytics_project.api.db.models import IoTData
-from db.db_connection import get_db_connection
-from db.models import IoTData
-from pydantic import BaseModel
+from typing import Dict, List, Tuple
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ValidationError
+# from iot_analytics_project.api.db.db_connection import acquire
+# from iot_analytics_project.api.db.dedup import recent_keys
+# from iot_analytics_project.api.db.latest import latest_readings
+# from iot_analytics_project.api.db.models import IoTData, IOT_DATA_ADAPTER, to_utc_naive
+# from iot_analytics_project.api.db.write_buffer import BufferFullError, write_buffer
+# from iot_analytics_project.api.instrumentation import ROWS_ACCEPTED, ROWS_DUPLICATE, ROWS_REJECTED
+# from iot_analytics_project.api.profiling import phase
+# from iot_analytics_project.api.routes.cache import cached_response, result_cache
+from db.db_connection import acquire
+from db.dedup import recent_keys
+from db.latest import latest_readings
+from db.models import IoTData, IOT_DATA_ADAPTER, to_utc_naive
+from db.write_buffer import BufferFullError, write_buffer
+from instrumentation import ROWS_ACCEPTED, ROWS_DUPLICATE, ROWS_REJECTED
+from profiling import phase
+from routes.cache import cached_response, result_cache
 
 router = APIRouter()
 
@@ -18,80 +33,147 @@ class IoTDataResponse(BaseModel):
     location: str
 
 
+class IoTDataPage(BaseModel):
+    data: List[IoTDataResponse]
+    limit: int
+    offset: int
+    count: int
+
+
 class DeviceResponse(BaseModel):
     device_id: str
     device_type: str
     location: str
 
 
-@router.post("/data")
-async def create_iot_data(data: IoTData):
-    # Connect to the database
-    conn = await get_db_connection()
+def paginated_response(records, limit: int, offset: int) -> ORJSONResponse:
+    """
+    Build the paginated envelope straight from asyncpg records, skipping per-row model construction.
+    :param records: rows returned by asyncpg
+    :param limit: page size requested by the client
+    :param offset: starting point requested by the client
+    :return: an ORJSONResponse holding the page
+    """
+    with phase("convert"):
+        data = [dict(record) for record in records]
+    with phase("serialize"):
+        return ORJSONResponse({"data": data, "limit": limit, "offset": offset, "count": len(data)})
+
 
-    # Prepare the query
-    query = """
-        INSERT INTO iot_data(timestamp, device_id, voltage, current, device_type, location)
-        VALUES($1, $2, $3, $4, $5, $6)
+def dedup_keys(data: IoTData, timestamp: datetime) -> list:
+    """
+    Keys identifying a reading: the id of the source message when the sender provides one and
+    the (device_id, timestamp) pair when the timestamp is set by the device.
+    :param data: validated reading
+    :param timestamp: timestamp of the reading normalized to naive UTC, as it is stored
+    :return: list of keys, empty when the reading cannot be identified
     """
+    keys = []
+    if data.message_id:
+        keys.append(data.message_id)
+    if data.timestamp:
+        keys.append((data.device_id, timestamp))
+    return keys
+
+
+# Dedup keys of the rows still waiting in the write buffer, by (device_id, timestamp) of the row
+_pending_keys: Dict[Tuple[str, datetime], list] = {}
 
-    # Insert the data into the table
+
+def _forget_written_keys(rows: List[tuple]):
+    for timestamp, device_id, *_ in rows:
+        _pending_keys.pop((device_id, timestamp), None)
+
+
+def _forget_dropped_keys(rows: List[tuple]):
+    # The rows were never written, a replay of them must not be taken for a duplicate
+    for timestamp, device_id, *_ in rows:
+        for key in _pending_keys.pop((device_id, timestamp), ()):
+            recent_keys.discard(key)
+
+
+write_buffer.add_flush_listener(_forget_written_keys)
+write_buffer.add_drop_listener(_forget_dropped_keys)
+
+
+@router.post("/data", status_code=202, openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": IoTData.model_json_schema()}},
+    }
+})
+async def create_iot_data(request: Request):
+    """
+    Accept a single reading. The row is buffered in memory and written to QuestDB in bulk by
+    the write-behind buffer, a 429 is returned when the buffer is full. Replayed readings are
+    acknowledged with a 200 without being written again.
+    """
+    # Validate the raw body in a single pass instead of json.loads + model construction
+    body = await request.body()
     try:
-        await conn.execute(
-            query,
-            data.timestamp or datetime.utcnow(),  # Use UTC now if no timestamp provided
-            data.device_id,
-            data.voltage,
-            data.current,
-            data.device_type,
-            data.location,
-        )
-    except Exception as e:
-        await conn.close()
-        raise HTTPException(status_code=500, detail=str(e))
+        with phase("validate"):
+            data = IOT_DATA_ADAPTER.validate_json(body)
+    except ValidationError as e:
+        # Same error layout as FastAPI's own body validation
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])}
+                                      for error in e.errors(include_url=False)])
+
+    timestamp = to_utc_naive(data.timestamp) if data.timestamp else datetime.utcnow()  # UTC now if not provided
+    keys = dedup_keys(data, timestamp)
+    if any(key in recent_keys for key in keys):
+        ROWS_DUPLICATE.inc()
+        return ORJSONResponse({"message": "Duplicate data ignored"}, status_code=200)
+
+    row = (
+        timestamp,
+        data.device_id,
+        data.voltage,
+        data.current,
+        data.device_type,
+        data.location,
+    )
+    try:
+        write_buffer.put(row)
+    except BufferFullError as e:
+        ROWS_REJECTED.inc()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
 
-    # Close the connection
-    await conn.close()
+    ROWS_ACCEPTED.inc()
+    latest_readings.update_row(row)
+    for key in keys:
+        recent_keys.add(key)
+    if keys:
+        _pending_keys.setdefault((data.device_id, timestamp), []).extend(keys)
 
-    return {"message": "Data inserted successfully"}
+    return ORJSONResponse({"message": "Data accepted"}, status_code=202)
 
 
-@router.get("/data/{device_id}")
+@router.get("/data/{device_id}", response_model=IoTDataPage)
 async def get_iot_data_by_device_id(device_id: str, limit:  int = Query(default=100, ge=0, le=1000),
                            offset: int = Query(default=0, ge=0, le=1000)):
-    conn = await get_db_connection()
+    key = (device_id, limit, offset)
+    body = result_cache.get("data_by_device", key)
+    if body is not None:
+        return cached_response(body)
 
-    query = """
+    # QuestDB's LIMIT lo, hi returns rows (lo, hi], so pagination happens in the database
+    query = f"""
         SELECT * FROM iot_data WHERE device_id = $1
+        LIMIT {offset}, {offset + limit}
     """
 
     try:
-        result = await conn.fetch(query, device_id)
+        async with acquire() as conn:
+            with phase("query"):
+                result = await conn.fetch(query, device_id)
     except Exception as e:
-        await conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
-    await conn.close()
-
-    # Apply offset manually by slicing the result
-    paginated_result = result[offset:offset + limit]
-
-    # Format the response as a list of IoTDataResponse objects
-    data = [
-        IoTDataResponse(
-            timestamp=row["timestamp"],
-            device_id=row["device_id"],
-            voltage=row["voltage"],
-            current=row["current"],
-            device_type=row["device_type"],
-            location=row["location"],
-        )
-        for row in paginated_result
-    ]
-
-    return data, offset
+    response = paginated_response(result, limit, offset)
+    result_cache.put("data_by_device", key, response.body, device_id=device_id)
+    return response
 
-@router.get("/data")
+@router.get("/data", response_model=IoTDataPage)
 async def get_all_iot_data(limit:  int = Query(default=100, ge=0, le=1000),
                            offset: int = Query(default=0, ge=0, le=1000)):
     """
@@ -102,60 +184,66 @@ async def get_all_iot_data(limit:  int = Query(default=100, ge=0, le=1000),
     - offset: Starting point for the query (default: 0).
 
     Returns:
-    - List of IoT data records.
+    - A page of IoT data records along with the pagination parameters.
     """
-    conn = await get_db_connection()
+    key = (limit, offset)
+    body = result_cache.get("data", key)
+    if body is not None:
+        return cached_response(body)
 
-    # Fetch more rows than needed, and apply offset manually
     query = f"""
-        SELECT * 
-        FROM iot_data 
-        ORDER BY timestamp DESC 
-        LIMIT {limit + offset}
+        SELECT *
+        FROM iot_data
+        ORDER BY timestamp DESC
+        LIMIT {offset}, {offset + limit}
     """
 
     try:
-        result = await conn.fetch(query)
+        async with acquire() as conn:
+            with phase("query"):
+                result = await conn.fetch(query)
     except Exception as e:
-        await conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
-    await conn.close()
+    response = paginated_response(result, limit, offset)
+    result_cache.put("data", key, response.body)
+    return response
 
-    # Apply offset manually by slicing the result
-    paginated_result = result[offset:offset + limit]
 
-    # Format the response as a list of IoTDataResponse objects
-    data = [
-        IoTDataResponse(
-            timestamp=row["timestamp"],
-            device_id=row["device_id"],
-            voltage=row["voltage"],
-            current=row["current"],
-            device_type=row["device_type"],
-            location=row["location"],
-        )
-        for row in paginated_result
-    ]
+@router.get("/devices/latest", response_model=List[IoTDataResponse])
+async def get_latest_readings():
+    """
+    Latest reading of every device, served from memory.
 
-    return data, offset
+    Returns:
+    - One record per device. Readings ingested by other API workers show up after at most
+      ``LATEST_RESYNC_INTERVAL_SECONDS``. While the database cannot be read, the readings known to this worker
+      are returned with an ``X-Stale: true`` header, and a 503 until it knows of any.
+    """
+    readings = latest_readings.snapshot()
+    if not readings and not latest_readings.synced:
+        raise HTTPException(status_code=503, detail="Latest readings are not loaded yet.",
+                            headers={"Retry-After": "1"})
 
+    with phase("serialize"):
+        return ORJSONResponse(readings, headers={"X-Stale": "true"} if latest_readings.stale else None)
 
-@router.get("/devices")
-async def get_all_devices():
-    conn = await get_db_connection()
 
+@router.get("/devices", response_model=List[str])
+async def get_all_devices():
     query = f"""
         SELECT DISTINCT device_id
         FROM iot_data
     """
 
     try:
-        result = await conn.fetch(query)
+        async with acquire() as conn:
+            with phase("query"):
+                result = await conn.fetch(query)
     except Exception as e:
-        await conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
-    await conn.close()
-
-    return list(map(lambda x: x.get('device_id'), result))
\ No newline at end of file
+    with phase("convert"):
+        devices = [record["device_id"] for record in result]
+    with phase("serialize"):
+        return ORJSONResponse(devices)
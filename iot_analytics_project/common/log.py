@@ -0,0 +1,22 @@
+"""
+Logging setup shared by the services.
+
+loguru writes every record from DEBUG up to stderr until it is configured otherwise, so every service calls
+``configure_logging`` when it starts. The per-message records of the hot paths are logged at DEBUG level with
+``{}`` arguments: below ``LOG_LEVEL`` they are dropped before their message is even formatted.
+"""
+import os
+import sys
+
+from loguru import logger
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """
+    Replace the default loguru sink with one on stderr that drops the records below ``level``.
+    :param level: minimum level written, e.g. DEBUG, INFO or WARNING
+    """
+    logger.remove()
+    logger.add(sys.stderr, level=level)
@@ -0,0 +1,64 @@
+"""
+Provisioning of the Kafka topics and the producer settings shared by the services writing to them.
+
+Topics are created explicitly instead of relying on broker auto-creation, so the partition count (the upper bound
+of consumer parallelism) and the compression are known. Readings are keyed by device id and partitioned by a hash
+of the key, so the readings of a device stay in one partition and in order.
+"""
+import os
+from typing import Dict, Optional
+
+from confluent_kafka import KafkaError, KafkaException
+from confluent_kafka.admin import AdminClient, NewTopic
+from loguru import logger
+
+TOPIC_PARTITIONS = int(os.getenv("TOPIC_PARTITIONS", 6))
+TOPIC_REPLICATION_FACTOR = int(os.getenv("TOPIC_REPLICATION_FACTOR", 3))
+# zstd compresses best, lz4 costs the least CPU
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "zstd")
+# Time the producer waits to fill a batch, larger batches compress better
+PRODUCER_LINGER_MS = int(os.getenv("PRODUCER_LINGER_MS", 20))
+
+
+def producer_config() -> Dict[str, str]:
+    """
+    Settings for ``Application(producer_extra_config=...)``.
+    murmur2_random hashes keys like the Java clients do, so every client agrees on the partition of a device.
+    """
+    return {
+        "compression.type": KAFKA_COMPRESSION,
+        "partitioner": "murmur2_random",
+        "linger.ms": str(PRODUCER_LINGER_MS),
+    }
+
+
+def ensure_topic(broker_address: str, name: str,
+                 partitions: int = TOPIC_PARTITIONS,
+                 replication_factor: int = TOPIC_REPLICATION_FACTOR,
+                 config: Optional[Dict[str, str]] = None,
+                 timeout: float = 30.0):
+    """
+    Create a topic unless it exists already. Existing topics are left untouched: adding partitions
+    would move devices to other partitions and break the ordering of their readings.
+    :param broker_address: comma separated list of brokers
+    :param name: name of the topic
+    :param partitions: number of partitions
+    :param replication_factor: number of replicas of every partition
+    :param config: topic level settings, compressed with ``KAFKA_COMPRESSION`` by default
+    :param timeout: seconds to wait for the brokers
+    """
+    admin = AdminClient({"bootstrap.servers": broker_address})
+    topic = NewTopic(name, num_partitions=partitions, replication_factor=replication_factor,
+                     config=config or {"compression.type": KAFKA_COMPRESSION})
+
+    try:
+        admin.create_topics([topic], request_timeout=timeout)[name].result(timeout)
+        logger.info(f"Created topic {name} ({partitions} partitions, replication factor {replication_factor}).")
+    except KafkaException as e:
+        if e.args[0].code() != KafkaError.TOPIC_ALREADY_EXISTS:
+            raise
+
+        existing = len(admin.list_topics(name, timeout=timeout).topics[name].partitions)
+        if existing != partitions:
+            logger.warning(f"Topic {name} exists with {existing} partitions instead of {partitions}, "
+                           f"leaving it as is.")
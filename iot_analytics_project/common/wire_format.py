@@ -0,0 +1,113 @@
+"""
+Encoding of the readings on the ``machinery-data`` topic, shared by the data generator and the forwarder.
+
+The producer names the encoding of every message in its ``wire-format`` header, so both encodings can coexist on
+the topic and consumers handle messages produced before the header existed (JSON). The msgpack encoding is a
+schema-versioned array ``[epoch_ms, voltage, current, device_type, location]`` where the device type and the
+location are small integer codes, or the plain string for values missing from the code tables.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import msgpack
+
+HEADER = "wire-format"
+JSON = "json"
+MSGPACK_V1 = "msgpack-v1"
+FORMATS = (JSON, MSGPACK_V1)
+
+# Encoding used by producers, consumers follow the header of every message
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", JSON)
+
+# Append only: codes are persisted on the topic, reordering them would change the meaning of retained messages
+DEVICE_TYPES = ("Sensor", "Actuator", "Controller", "Battery Powered", "High Power Device")
+LOCATIONS = ("packaging", "production", "warehouse")
+
+_DEVICE_TYPE_CODES = {value: code for code, value in enumerate(DEVICE_TYPES)}
+_LOCATION_CODES = {value: code for code, value in enumerate(LOCATIONS)}
+_HEADER_VALUES = {wire_format: wire_format.encode("utf-8") for wire_format in FORMATS}
+# Timestamps are naive UTC throughout the pipeline
+_EPOCH = datetime(1970, 1, 1)
+
+Headers = List[Tuple[str, bytes]]
+
+
+def to_epoch_ms(timestamp: Union[str, datetime]) -> int:
+    """
+    Milliseconds since the epoch of a naive UTC timestamp.
+    :param timestamp: datetime or ISO 8601 string, e.g. "2025-01-01 12:34:56"
+    """
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH) // timedelta(milliseconds=1)
+
+
+def from_epoch_ms(epoch_ms: int) -> str:
+    """ISO 8601 string of a timestamp in milliseconds since the epoch."""
+    return (_EPOCH + timedelta(milliseconds=epoch_ms)).isoformat()
+
+
+def encode(record: Dict[str, Any], wire_format: str = WIRE_FORMAT) -> Tuple[bytes, Headers]:
+    """
+    Encode a reading produced by the data generator.
+    :param record: reading with timestamp, voltage, current, device_type and location
+    :param wire_format: one of ``FORMATS``
+    :return: the message value and the headers naming its encoding
+    """
+    if wire_format == MSGPACK_V1:
+        value = msgpack.packb([
+            to_epoch_ms(record["timestamp"]),
+            record["voltage"],
+            record["current"],
+            _DEVICE_TYPE_CODES.get(record["device_type"], record["device_type"]),
+            _LOCATION_CODES.get(record["location"], record["location"]),
+        ])
+    elif wire_format == JSON:
+        value = json.dumps(record).encode("utf-8")
+    else:
+        raise ValueError(f"Unknown wire format '{wire_format}', expected one of {FORMATS}")
+    return value, [(HEADER, _HEADER_VALUES[wire_format])]
+
+
+def header_format(headers: Optional[Headers]) -> str:
+    """
+    Encoding named by the headers of a message, JSON when they do not name any.
+    :param headers: headers of the message as returned by the Kafka client
+    """
+    for key, value in headers or ():
+        if key == HEADER:
+            return value.decode("utf-8") if isinstance(value, bytes) else value
+    return JSON
+
+
+def decode(value: bytes, headers: Optional[Headers]) -> Dict[str, Any]:
+    """
+    Decode a reading from the topic, whatever its encoding.
+    :param value: message value
+    :param headers: message headers
+    :return: reading with timestamp (ISO 8601 string), voltage, current, device_type and location
+    """
+    wire_format = header_format(headers)
+    if wire_format == MSGPACK_V1:
+        epoch_ms, voltage, current, device_type, location = msgpack.unpackb(value)
+        return {
+            "timestamp": from_epoch_ms(epoch_ms),
+            "voltage": voltage,
+            "current": current,
+            "device_type": DEVICE_TYPES[device_type] if isinstance(device_type, int) else device_type,
+            "location": LOCATIONS[location] if isinstance(location, int) else location,
+        }
+    if wire_format == JSON:
+        record = json.loads(value)
+        return {
+            "timestamp": record.get("timestamp"),
+            "voltage": record.get("voltage"),
+            "current": record.get("current"),
+            "device_type": record.get("device_type"),
+            "location": record.get("location"),
+        }
+    raise ValueError(f"Unknown wire format '{wire_format}', expected one of {FORMATS}")
@@ -1,8 +1,6 @@
 from enum import Enum
 
 import pandas as pd
-from adtk.data import validate_series
-from adtk.detector import QuantileAD
 from pydantic import confloat
 
 
@@ -44,6 +42,10 @@ def adtk_anomaly_detection(time_series: pd.Series, low=0.01, high=0.99):
     :param high: biggest quantile
     :return:
     """
+    # adtk (and the scikit-learn/statsmodels stack under it) takes longer to import than the rest of the dashboard,
+    # so it is only imported once a quantile detection actually runs
+    from adtk.data import validate_series
+    from adtk.detector import QuantileAD
 
     ts_valid = validate_series(time_series)
 
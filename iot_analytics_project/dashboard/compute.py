@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+from anomaly_detection import anomaly_detection_methods_mapper
+from dashboard_metrics import COMPUTE_REQUESTS
+
+# Processes running anomaly detections, shared by every dashboard session
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", 2))
+# Number of detection results kept in memory
+COMPUTE_MEMO_SIZE = int(os.getenv("COMPUTE_MEMO_SIZE", 256))
+
+
+class AnomalyKey(NamedTuple):
+    device: str
+    variable: str
+    method: str
+    low: float
+    high: float
+    # Changes whenever the data of the device changes, see data_version()
+    data_version: Tuple
+
+
+def data_version(data: List[Dict[str, Any]]) -> Tuple:
+    """
+    Cheap fingerprint of the data of a device: readings are only ever appended.
+    :param data: data fetched by the API from a device
+    """
+    return (len(data), data[-1].get("timestamp")) if data else (0, None)
+
+
+def detect(index: np.ndarray, values: np.ndarray, method: str, low: float, high: float) -> np.ndarray:
+    """
+    Run an anomaly detection method, in a worker process.
+    :param index: timestamps of the time series
+    :param values: values of the time series
+    :param method: one of AnomalyDetectionMethodOptions
+    :param low: low threshold
+    :param high: high threshold
+    :return: boolean mask of the anomalous values
+    """
+    time_series = pd.Series(values, index=pd.DatetimeIndex(index))
+    return anomaly_detection_methods_mapper[method](time_series, low, high).to_numpy(dtype=bool)
+
+
+def create_executor(workers: int = COMPUTE_WORKERS) -> ProcessPoolExecutor:
+    """Process pool for the detections. Workers are spawned, forking the multithreaded Streamlit server is unsafe."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class AnomalyCompute:
+    """
+    Runs anomaly detections on an executor and memoizes their results by ``AnomalyKey``.
+
+    Submitting a detection on behalf of a panel cancels the detection previously submitted for that panel
+    if it has not started yet, since a newer interaction (e.g. moving a threshold) made it obsolete. Only queued
+    detections can be cancelled: when every worker is busy with other panels or sessions. A detection that already
+    runs finishes and is memoized; the dashboard does not wait for it, see ``result``.
+    """
+
+    def __init__(self, executor: Executor, memo_size: int = COMPUTE_MEMO_SIZE):
+        self.executor = executor
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[AnomalyKey, Future]" = OrderedDict()
+        # Every Streamlit session runs its script in its own thread
+        self._lock = threading.Lock()
+
+    def submit(self, key: AnomalyKey, time_series: pd.Series, replaces: Optional[AnomalyKey] = None) -> Future:
+        """
+        Start a detection unless its result is known or being computed already.
+        :param key: identifies the detection
+        :param time_series: values indexed by timestamp
+        :param replaces: key previously submitted for the same panel, cancelled if still pending
+        :return: future holding the boolean mask of the anomalous values
+        """
+        with self._lock:
+            if replaces is not None and replaces != key:
+                previous = self._memo.get(replaces)
+                if previous is not None and previous.cancel():
+                    del self._memo[replaces]
+                    COMPUTE_REQUESTS.labels("cancelled").inc()
+
+            future = self._memo.get(key)
+            # Cancelled or failed detections are submitted again
+            if future is not None and not future.cancelled() and not (future.done() and future.exception()):
+                self._memo.move_to_end(key)
+                COMPUTE_REQUESTS.labels("hit").inc()
+                return future
+
+            future = self.executor.submit(detect, time_series.index.to_numpy(), time_series.to_numpy(),
+                                          key.method, key.low, key.high)
+            self._memo[key] = future
+            COMPUTE_REQUESTS.labels("submitted").inc()
+            self._evict()
+            return future
+
+    def result(self, key: AnomalyKey, time_series: pd.Series, future: Future, poll_seconds: Optional[float] = None,
+               on_wait: Optional[Callable[[float], None]] = None) -> np.ndarray:
+        """
+        Wait for a detection, submitting it again if another session cancelled it meanwhile.
+        Streamlit only stops a run made obsolete by a newer interaction at its next st.* call, so the dashboard
+        passes ``on_wait`` to make one while it waits instead of blocking on the future until the detection is done.
+        :param key: identifies the detection
+        :param time_series: values indexed by timestamp
+        :param future: future returned by ``submit``
+        :param poll_seconds: seconds between calls of ``on_wait``, None to block until the detection is done
+        :param on_wait: called with the seconds waited so far, every ``poll_seconds`` until the detection is done
+        :return: boolean mask of the anomalous values
+        """
+        start = time.monotonic()
+        while True:
+            try:
+                return future.result(timeout=poll_seconds)
+            except CancelledError:
+                future = self.submit(key, time_series)
+            except TimeoutError:
+                if on_wait is not None:
+                    on_wait(time.monotonic() - start)
+
+    def _evict(self):
+        # Only finished detections are evicted, pending ones are still awaited by a session
+        excess = len(self._memo) - self.memo_size
+        for key in [key for key, future in self._memo.items() if future.done()][:max(excess, 0)]:
+            del self._memo[key]
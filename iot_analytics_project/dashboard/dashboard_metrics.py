@@ -0,0 +1,6 @@
+from common.metrics import Counter, Histogram
+
+FETCH_SECONDS = Histogram("dashboard_fetch_seconds", "Latency of requests to the API by endpoint.", ["endpoint"])
+RENDER_SECONDS = Histogram("dashboard_render_seconds", "Time spent building a panel, including its computations.",
+                           ["panel"])
+COMPUTE_REQUESTS = Counter("dashboard_compute_requests", "Anomaly detections requested by outcome.", ["outcome"])
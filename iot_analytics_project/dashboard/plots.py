@@ -1,12 +1,13 @@
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional
 import pandas as pd
 import plotly.express as px
 import numpy as np
-from scipy.stats import gaussian_kde
 import plotly.graph_objs as go
 from anomaly_detection import anomaly_detection_methods_mapper
+from dashboard_metrics import RENDER_SECONDS
 
 
+@RENDER_SECONDS.labels("line_chart").time()
 def render_line_chart(data: Dict[str, Any], container: Any, chart_params: Dict):
     """
     Produce and render line chart plot on UI
@@ -50,6 +51,7 @@ def render_line_chart(data: Dict[str, Any], container: Any, chart_params: Dict):
         container.write("No data available for this device.")
 
 
+@RENDER_SECONDS.labels("histogram_chart").time()
 def render_histogram_chart(data: dict, container, chart_params: dict):
     """
     Produce and render histogram plot on UI
@@ -80,6 +82,8 @@ def render_histogram_chart(data: dict, container, chart_params: dict):
 
     hist_values, bin_edges = np.histogram(x_data, bins=num_bins, density=False)  # Frequency histogram
 
+    # scipy is only needed for the KDE, imported on the first histogram rather than on every cold start
+    from scipy.stats import gaussian_kde
 
     kde = gaussian_kde(x_data, bw_method='scott')  # Scott's rule for bandwidth
     kde_x = np.linspace(min(x_data), max(x_data), 200)  # Generate smooth x-values for KDE
@@ -117,41 +121,42 @@ def render_histogram_chart(data: dict, container, chart_params: dict):
 
     container.plotly_chart(fig, use_container_width=True)
 
-def detect_and_plot_anomalies(data: Dict[str, Any], container, chart_params: Dict):
+def to_time_series(data: Dict[str, Any], variable: str) -> pd.Series:
     """
-    Detect anomalies in a time series using ADTK or thresholds and plot them in a Streamlit app.
+    Extract a variable from the data of a device as a time series indexed by timestamp.
     :param data: data fetched by the API from a device
-    :param container: container in UI that this plot will be placed, e.g. row 1 column 1
-    :param chart_params: dictionary containing parameters that specify, color, column from data and other stuff,
-        e.g. chart_params: {
-            "color":"yellow",
-            "title":"Current for device: 12as-asda13",
-            "variable":"current"
-        }
-    :return:
+    :param variable: column to extract, e.g. "current"
+    :return: the time series
+    :raises ValueError: with a message for the UI when there is nothing to analyse
     """
-
     df = pd.DataFrame.from_dict(data, orient="columns")
 
     # Ensure required columns exist
-    if "timestamp" not in df.columns or chart_params["x"] not in df.columns:
-        container.write(f"Missing required columns: 'timestamp' or '{chart_params['x']}'")
-        return
+    if "timestamp" not in df.columns or variable not in df.columns:
+        raise ValueError(f"Missing required columns: 'timestamp' or '{variable}'")
 
     df["timestamp"] = pd.to_datetime(df["timestamp"])
     df.set_index("timestamp", inplace=True)
 
     # Extract the selected column as a Series
-    time_series = df[chart_params["x"]]
+    time_series = df[variable]
 
     if time_series.empty:
-        container.write("No data available for anomaly detection.")
-        return
+        raise ValueError("No data available for anomaly detection.")
+    return time_series
 
-    # Run anomaly detection method
-    low = chart_params.get("low", 0.01)  # Default to 0.01 if not specified
-    high = chart_params.get("high", 0.99)  # Default to 0.99 if not specified
-    anomalies = anomaly_detection_methods_mapper[chart_params['anomaly_method']](time_series, low, high)
+
+@RENDER_SECONDS.labels("anomaly_chart").time()
+def render_anomaly_chart(time_series: pd.Series, anomalies, container, variable: str):
+    """
+    Plot a time series with its anomalies highlighted.
+    :param time_series: values indexed by timestamp
+    :param anomalies: boolean mask of the anomalous values, aligned with ``time_series``
+    :param container: container in UI that this plot will be placed, e.g. row 1 column 1
+    :param variable: name of the plotted variable
+    :return:
+    """
+    anomalies = np.asarray(anomalies, dtype=bool)
 
     fig = go.Figure()
 
@@ -175,7 +180,7 @@ def detect_and_plot_anomalies(data: Dict[str, Any], container, chart_params: Dic
         ))
 
     fig.update_layout(
-        title=f"Anomaly Detection for {chart_params['x']}",
+        title=f"Anomaly Detection for {variable}",
         xaxis_title="Time",
         yaxis_title="Value",
         plot_bgcolor="rgba(0,0,0,0)",
@@ -183,4 +188,57 @@ def detect_and_plot_anomalies(data: Dict[str, Any], container, chart_params: Dic
     )
 
     # Display the plot in Streamlit
-    container.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+    container.plotly_chart(fig, use_container_width=True)
+
+
+@RENDER_SECONDS.labels("derived_windows").time()
+def render_derived_windows(windows: Optional[List[Dict[str, Any]]], container, window: str):
+    """
+    Produce and render the energy of every window aggregate precomputed by the stream processor
+    :param windows: window aggregates fetched from GET /derived, with window_start and energy_wh
+    :param container: container in UI that this plot will be placed, e.g. row 1 column 1
+    :param window: name of the windows, e.g. "1h" or "24h/6h" for hopping windows
+    :return:
+    """
+    if not windows:
+        container.write(f"No {window} windows available for this device.")
+        return
+
+    df = pd.DataFrame.from_dict(windows, orient="columns")
+    fig = px.bar(df, x="window_start", y="energy_wh", title=f"Energy per {window} window")
+    fig.update_layout(
+        xaxis_title="Window start",
+        yaxis_title="Energy (Wh)",
+        template="plotly_white",
+        height=400,
+    )
+    container.plotly_chart(fig, use_container_width=True)
+
+
+@RENDER_SECONDS.labels("anomalies").time()
+def detect_and_plot_anomalies(data: Dict[str, Any], container, chart_params: Dict):
+    """
+    Detect anomalies in a time series using ADTK or thresholds and plot them in a Streamlit app.
+    Detection runs inline, the dashboard itself runs it in the background with compute.py.
+    :param data: data fetched by the API from a device
+    :param container: container in UI that this plot will be placed, e.g. row 1 column 1
+    :param chart_params: dictionary containing parameters that specify, color, column from data and other stuff,
+        e.g. chart_params: {
+            "color":"yellow",
+            "title":"Current for device: 12as-asda13",
+            "variable":"current"
+        }
+    :return:
+    """
+    try:
+        time_series = to_time_series(data, chart_params["x"])
+    except ValueError as e:
+        container.write(str(e))
+        return
+
+    # Run anomaly detection method
+    low = chart_params.get("low", 0.01)  # Default to 0.01 if not specified
+    high = chart_params.get("high", 0.99)  # Default to 0.99 if not specified
+    anomalies = anomaly_detection_methods_mapper[chart_params['anomaly_method']](time_series, low, high)
+
+    render_anomaly_chart(time_series, anomalies, container, chart_params["x"])
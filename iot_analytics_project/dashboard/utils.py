@@ -1,22 +1,77 @@
-from typing import Dict
+import os
+from typing import Any, Dict, List, Optional
+import numpy as np
 import pandas as pd
+from dashboard_metrics import RENDER_SECONDS
 
-def calculate_statistics(data: Dict) -> pd.DataFrame:
+# Same as the stream processor: a longer gap between two readings is not integrated, e.g. the device was off
+MAX_INTEGRATION_GAP_MINUTES = int(os.getenv("MAX_INTEGRATION_GAP_MINUTES", 6 * 60))
+
+
+def integrate_energy(df: pd.DataFrame, windows: Optional[List[Dict[str, Any]]] = None) -> float:
+    """
+    Energy in kWh, integrating power over the real time between readings with the trapezoidal rule.
+    :param df: readings with timestamp and power
+    :param windows: non-overlapping (tumbling) window aggregates precomputed by the stream processor, see
+        GET /derived. Their energy is taken as is and only the readings outside of them are integrated here
+    :return: total energy in kWh
+    """
+    timestamps = pd.to_datetime(df["timestamp"], format="ISO8601").to_numpy(dtype="datetime64[ns]")
+    power = df["power"].to_numpy(dtype=float)
+    if (timestamps[1:] < timestamps[:-1]).any():
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, power = timestamps[order], power[order]
+
+    hours = np.diff(timestamps).astype(np.int64) / 3_600e9
+    energy_wh = (power[1:] + power[:-1]) / 2 * hours
+    # Every interval is counted with the reading ending it, as the stream processor does
+    counted = hours <= MAX_INTEGRATION_GAP_MINUTES / 60
+
+    if not windows:
+        return energy_wh[counted].sum() / 1000
+
+    first = np.datetime64(min(pd.Timestamp(window["window_start"]) for window in windows), "ns")
+    last = np.datetime64(max(pd.Timestamp(window["window_end"]) for window in windows), "ns")
+    ends = timestamps[1:]
+    outside = counted & ((ends < first) | (ends >= last))
+    return (sum(window["energy_wh"] for window in windows) + energy_wh[outside].sum()) / 1000
+
+
+def describe(series: pd.Series) -> Dict[str, float]:
+    """
+    The statistics of ``Series.describe()`` shown in the summary, computed with numpy: describe() builds a Series
+    of eight statistics with several quantiles, which costs more than the rest of the summary.
+    :param series: numeric values, missing values are skipped
+    :return: mean, std (sample), min, max and 50% (median)
+    """
+    values = series.to_numpy(dtype=float)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return dict.fromkeys(("mean", "std", "min", "max", "50%"), np.nan)
+    return {
+        "mean": values.mean(),
+        "std": values.std(ddof=1) if len(values) > 1 else np.nan,
+        "min": values.min(),
+        "max": values.max(),
+        "50%": np.median(values),
+    }
+
+
+@RENDER_SECONDS.labels("statistics").time()
+def calculate_statistics(data: Dict, windows: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
     """
     Produce statistics from data
     :param data: data from API
+    :param windows: window aggregates of the device precomputed by the stream processor, if any
     :return:
     """
 
     df = pd.DataFrame.from_dict(data, orient="columns")
 
-    voltage_stats = df["voltage"].describe()
-    current_stats = df["current"].describe()
-
     # Power and Energy
     df["power"] = df["voltage"] * df["current"]  # Power (P = V * I)
-    power_stats = df["power"].describe()
-    total_energy = (df["power"].sum() / 1000) * (1 / 60)  # Assuming hourly data -> kWh
+    voltage_stats, current_stats, power_stats = (describe(df[column]) for column in ("voltage", "current", "power"))
+    total_energy = integrate_energy(df, windows)  # kWh
 
     # Correlation
     correlation = df["voltage"].corr(df["current"])
@@ -1,10 +1,15 @@
-import time
-from typing import Any, Dict, List, Optional
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
 from loguru import logger
+from common.metrics import start_http_server
 from anomaly_detection import AnomalyDetectionMethodOptions
-from plots import render_line_chart, render_histogram_chart, detect_and_plot_anomalies
+from compute import AnomalyCompute, AnomalyKey, create_executor, data_version
+from plots import render_line_chart, render_histogram_chart, render_anomaly_chart, render_derived_windows, to_time_series
+from dashboard_metrics import FETCH_SECONDS
 from utils import calculate_statistics
 
 # Constants
@@ -13,6 +18,17 @@ from utils import calculate_statistics
 BASE_URL = "http://api:8000"
 DEVICE_ENDPOINT = f"{BASE_URL}/devices"
 DATA_ENDPOINT = f"{BASE_URL}/data"
+DERIVED_ENDPOINT = f"{BASE_URL}/derived"
+# Connections to the API kept open, shared by every session of the dashboard
+API_POOL_SIZE = 10
+# How often a run waiting for an anomaly detection gives Streamlit a chance to stop it for a newer run
+DETECTION_POLL_SECONDS = 0.1
+# Windows produced by the stream processor that can be shown, named as in its window_name()
+DERIVED_WINDOWS = os.getenv("DERIVED_WINDOWS", "1h,24h/6h").split(",")
+# Tumbling window whose energy is added up for the total energy, overlapping (hopping) windows would count it twice
+ENERGY_WINDOW = os.getenv("ENERGY_WINDOW", "1h")
+# Statistics kept in memory, one entry per device and version of its data
+STATISTICS_CACHE_SIZE = 64
 
 if "show_table" not in st.session_state:
     st.session_state.show_table = False
@@ -36,10 +52,33 @@ row_1_col_1, row_1_col_2 = st.columns([50, 50])
 
 
 
+@st.cache_resource(show_spinner=False)
+def get_api_adapter() -> HTTPAdapter:
+    """
+    Connection pool to the API shared by the whole dashboard, so connections are reused across reruns and sessions.
+    The urllib3 pool behind the adapter is thread safe, unlike ``requests.Session`` itself.
+    """
+    return HTTPAdapter(pool_maxsize=API_POOL_SIZE)
+
+
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """HTTP session of the current script thread, sending its requests through the shared connection pool."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount(BASE_URL, get_api_adapter())
+        _local.session = session
+    return session
+
+
 def fetch_device_ids() -> Optional[List[str]]:
     """Fetch available device IDs from the API."""
     try:
-        response = requests.get(DEVICE_ENDPOINT)
+        with FETCH_SECONDS.labels("devices").time():
+            response = get_session().get(DEVICE_ENDPOINT)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
@@ -51,7 +90,8 @@ def fetch_device_ids() -> Optional[List[str]]:
 def fetch_device_data(device_id: str) -> Optional[Dict[str, Any]]:
     """Fetch data for a specific device."""
     try:
-        response = requests.get(f"{DATA_ENDPOINT}/{device_id}")
+        with FETCH_SECONDS.labels("data").time():
+            response = get_session().get(f"{DATA_ENDPOINT}/{device_id}")
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
@@ -59,7 +99,78 @@ def fetch_device_data(device_id: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+@st.cache_data(ttl=60)
+def fetch_derived_windows(device_id: str, window: str, start: str, end: str) -> Optional[List[Dict[str, Any]]]:
+    """Fetch the window aggregates of a device precomputed by the stream processor, between two timestamps."""
+    try:
+        with FETCH_SECONDS.labels("derived").time():
+            response = get_session().get(f"{DERIVED_ENDPOINT}/{device_id}",
+                                         params={"window": window, "start": start, "end": end})
+        response.raise_for_status()
+        return response.json()["data"]
+    except requests.RequestException as e:
+        logger.error(f"Failed to fetch derived data for device {device_id}: {e}")
+        return None
+
+
+@st.cache_data(max_entries=STATISTICS_CACHE_SIZE, show_spinner=False)
+def device_statistics(device: str, version: Tuple, windows_version: Tuple, _data: List[Dict[str, Any]],
+                      _windows: Optional[List[Dict[str, Any]]]):
+    """
+    Statistics of a device, computed once per version of its data and windows instead of on every rerun.
+    Streamlit does not hash the arguments starting with an underscore, the versions stand in for them.
+    """
+    return calculate_statistics(_data, _windows)
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    """Serve the dashboard metrics once per process, not on every rerun of this script."""
+    return start_http_server()
+
+
+@st.cache_resource(show_spinner=False)
+def get_compute() -> AnomalyCompute:
+    """One process pool and memo for the whole dashboard, shared by every session."""
+    return AnomalyCompute(create_executor())
+
+
+def render_anomalies(device: str, data: List[Dict[str, Any]], panels: List[Tuple[Any, Dict]]):
+    """
+    Run the anomaly detections of all panels concurrently off the script thread, then plot them as they complete.
+    :param device: selected device
+    :param data: data fetched by the API from the device
+    :param panels: (container, chart_params) of every panel, with chart_params holding x, anomaly_method, low and high
+    """
+    compute = get_compute()
+    version = data_version(data)
+
+    pending = []
+    for container, chart_params in panels:
+        try:
+            time_series = to_time_series(data, chart_params["x"])
+        except ValueError as e:
+            container.write(str(e))
+            continue
+
+        key = AnomalyKey(device, chart_params["x"], chart_params["anomaly_method"],
+                         chart_params["low"], chart_params["high"], version)
+        # The detection this session last requested for the panel is obsolete once the key changes
+        state_key = f"anomaly_key_{chart_params['x']}"
+        future = compute.submit(key, time_series, replaces=st.session_state.get(state_key))
+        st.session_state[state_key] = key
+        pending.append((container, chart_params["x"], key, time_series, future))
+
+    for container, variable, key, time_series, future in pending:
+        placeholder = container.empty()
+        anomalies = compute.result(key, time_series, future, poll_seconds=DETECTION_POLL_SECONDS,
+                                   on_wait=lambda waited: placeholder.caption(
+                                       f"Detecting anomalies in {variable}... {waited:.1f} s"))
+        render_anomaly_chart(time_series, anomalies, placeholder, variable)
+
+
 def main():
+    start_metrics_server()
 
     device_ids = fetch_device_ids()
 
@@ -70,13 +181,21 @@ def main():
             if device_ids
             else None
         )
+        window = st.selectbox("Derived window", options=DERIVED_WINDOWS,
+                              index=DERIVED_WINDOWS.index(ENERGY_WINDOW) if ENERGY_WINDOW in DERIVED_WINDOWS else 0)
 
     with header:
 
         if device:
-            data, offset = fetch_device_data(device)
+            page = fetch_device_data(device)
+            data = page["data"] if page else []
             st.header(f"Statistics for device: {device}")
-            statistics = calculate_statistics(data)
+            timestamps = [row["timestamp"] for row in data]
+            start, end = (min(timestamps), max(timestamps)) if data else (None, None)
+            energy_windows = fetch_derived_windows(device, ENERGY_WINDOW, start, end) if data else None
+            windows_version = ((len(energy_windows), energy_windows[-1]["window_end"]) if energy_windows
+                               else (0, None))
+            statistics = device_statistics(device, data_version(data), windows_version, data, energy_windows)
 
             st.button("Show/Hide Statistics", on_click=toggle_table)
 
@@ -84,6 +203,10 @@ def main():
             if st.session_state.show_table:
                 st.table(statistics)
 
+            windows = energy_windows if window == ENERGY_WINDOW else (
+                fetch_derived_windows(device, window, start, end) if data else None)
+            render_derived_windows(windows, header, window)
+
         with row_1_col_1:
             st.header("Plots")
 
@@ -121,13 +244,6 @@ def main():
                     "High Threshold:", value=1.0, key="e_current_high_threshold"
                 )
 
-            detect_and_plot_anomalies(
-                data=data, container=row_1_col_1,
-                chart_params=dict(x="current", quantile=True,
-                                  anomaly_method=e_current_plot_anomaly_method,
-                                  low=e_current_low_thresh,
-                                  high=e_current_high_thresh)
-            )
             with row_1_col_2:
                 st.header("")
                 voltage_plot_anomaly_method = st.selectbox("anomaly detection method:",
@@ -138,13 +254,12 @@ def main():
                     voltage_low_thresh = st.number_input("Low Threshold: ",value=0.0, key="voltage_low_threshold")
                 with col2:
                     voltage_high_thresh = st.number_input("High Threshold: ",value=1.0, key="voltage_high_threshold")
-            detect_and_plot_anomalies(
-                data=data, container=row_1_col_2,
-                chart_params=dict(x="voltage", quantile=True,
-                                  anomaly_method=voltage_plot_anomaly_method,
-                                  low=voltage_low_thresh, high=voltage_high_thresh
-                                  )
-            )
+            render_anomalies(device, data, [
+                (row_1_col_1, dict(x="current", anomaly_method=e_current_plot_anomaly_method,
+                                   low=e_current_low_thresh, high=e_current_high_thresh)),
+                (row_1_col_2, dict(x="voltage", anomaly_method=voltage_plot_anomaly_method,
+                                   low=voltage_low_thresh, high=voltage_high_thresh)),
+            ])
 
         with row_1_col_2:
             for i in range(statistics.shape[1] + 1):
@@ -0,0 +1,269 @@
+"""
+Bulk import of historical readings from CSV or Parquet files into QuestDB, bypassing Kafka and the API.
+
+Files are streamed in chunks (memory-mapped where the reader supports it), their columns mapped to the ``iot_data``
+schema and written over InfluxDB Line Protocol by parallel senders, one HTTP transaction per chunk. Progress is
+checkpointed to a JSON file after every chunk, so an interrupted import resumes where it stopped. Chunks in flight
+when it stopped are sent again, which the dedup keys of ``iot_data`` turn into no-ops.
+
+Example:
+    python bulk_import.py readings_2024.parquet --map timestamp=ts --map device_id=sensor \\
+        --conf "http::addr=localhost:9000;" --workers 4
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+from loguru import logger
+from questdb.ingress import Sender
+
+# Connection string of the QuestDB client, see https://questdb.io/docs/configuration-string/
+QDB_CLIENT_CONF = os.getenv("QDB_CLIENT_CONF", "http::addr=localhost:9000;")
+TABLE_NAME = "iot_data"
+COLUMNS = ["timestamp", "device_id", "voltage", "current", "device_type", "location"]
+
+
+def parse_mapping(pairs: List[str]) -> Dict[str, str]:
+    """
+    Parse ``--map`` options into a mapping from source to ``iot_data`` column names.
+    :param pairs: ``column=source`` pairs, columns that are not mapped are expected under their own name
+    :return: source column name -> iot_data column name
+    """
+    mapping = {column: column for column in COLUMNS}
+    for pair in pairs:
+        column, _, source = pair.partition("=")
+        if column not in COLUMNS or not source:
+            raise ValueError(f"Invalid mapping '{pair}', expected <column>=<source> "
+                                             f"with column one of {COLUMNS}")
+        mapping[column] = source
+    return {source: column for column, source in mapping.items()}
+
+
+def read_chunks(path: str, columns: List[str], chunk_rows: int, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Stream a CSV or Parquet file in chunks of ``chunk_rows`` rows.
+    :param path: path of the file, its format is taken from the extension
+    :param columns: source columns to read
+    :param chunk_rows: rows per chunk
+    :param skip_rows: number of data rows already imported, skipped without being parsed where possible
+    """
+    if path.endswith(".parquet"):
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_rows, columns=columns)
+        position = 0
+        for batch in batches:
+            if position + batch.num_rows > skip_rows:
+                yield batch.slice(max(0, skip_rows - position)).to_pandas()
+            position += batch.num_rows
+    else:
+        # The header is read on its own, so the imported rows can be skipped by count: a range of rows to skip
+        # would be turned into a set by pandas, gigabytes of memory for the files this tool is meant for
+        names = pd.read_csv(path, nrows=0).columns
+        yield from pd.read_csv(path, header=None, names=names, skiprows=skip_rows + 1, usecols=columns,
+                               chunksize=chunk_rows, memory_map=True)
+
+
+def to_schema(chunk: pd.DataFrame, mapping: Dict[str, str]) -> pd.DataFrame:
+    """
+    Rename and convert the columns of a chunk to the ``iot_data`` schema.
+    :param chunk: chunk read from the source file
+    :param mapping: source column name -> iot_data column name
+    """
+    chunk = chunk.rename(columns=mapping)[COLUMNS]
+    # Naive timestamps are taken as UTC, like everywhere else in the pipeline
+    chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], utc=True)
+    chunk["voltage"] = chunk["voltage"].astype("float64")
+    chunk["current"] = chunk["current"].astype("float64")
+    for column in ("device_id", "device_type", "location"):
+        chunk[column] = chunk[column].astype(str)
+    return chunk
+
+
+class Checkpoint:
+    """
+    Number of rows imported per file, persisted as JSON. Chunks complete out of order, so only the contiguous
+    run of completed rows from the start of the file is recorded. Progress is kept in rows rather than chunks,
+    so a resumed import may use another ``--chunk-rows``.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._state: Dict[str, dict] = {}
+        # First row -> number of rows of the chunks completed ahead of the contiguous run
+        self._pending: Dict[str, Dict[int, int]] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._state = json.load(f)
+
+    def rows_done(self, source: str) -> int:
+        return self._state.get(source, {}).get("rows", 0)
+
+    def chunk_rows(self, source: str) -> Optional[int]:
+        """Rows per chunk of the run that recorded the progress of a file, None if there was none."""
+        return self._state.get(source, {}).get("chunk_rows")
+
+    def is_complete(self, source: str) -> bool:
+        return self._state.get(source, {}).get("complete", False)
+
+    def start(self, source: str, chunk_rows: int):
+        """
+        Record the chunk size of the run importing a file.
+        :param source: path of the file
+        :param chunk_rows: rows per chunk
+        """
+        self._state.setdefault(source, {"rows": 0, "complete": False})["chunk_rows"] = chunk_rows
+        self._save()
+
+    def chunk_done(self, source: str, first_row: int, rows: int):
+        """
+        Record an imported chunk.
+        :param source: path of the file
+        :param first_row: position in the file of the first row of the chunk
+        :param rows: rows in the chunk
+        """
+        state = self._state.setdefault(source, {"rows": 0, "complete": False})
+        pending = self._pending.setdefault(source, {})
+        pending[first_row] = rows
+        while state["rows"] in pending:
+            state["rows"] += pending.pop(state["rows"])
+        self._save()
+
+    def file_done(self, source: str):
+        self._state.setdefault(source, {"rows": 0})["complete"] = True
+        self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        # Written to a temporary file first, so an interruption never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class ParallelWriter:
+    """
+    Sends chunks to QuestDB from a pool of threads, each with its own ILP sender (senders are not thread safe).
+    """
+
+    def __init__(self, conf: str, table: str, workers: int):
+        self.conf = conf
+        self.table = table
+        self.workers = workers
+        self._local = threading.local()
+        self._senders: List[Sender] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ilp")
+
+    def _sender(self) -> Sender:
+        sender = getattr(self._local, "sender", None)
+        if sender is None:
+            sender = Sender.from_conf(self.conf)
+            sender.establish()
+            self._local.sender = sender
+            with self._lock:
+                self._senders.append(sender)
+        return sender
+
+    def _write(self, chunk: pd.DataFrame) -> int:
+        sender = self._sender()
+        sender.dataframe(chunk, table_name=self.table, symbols=False, at="timestamp")
+        sender.flush()
+        return len(chunk)
+
+    def submit(self, chunk: pd.DataFrame):
+        return self._executor.submit(self._write, chunk)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for sender in self._senders:
+            sender.close()
+
+
+def import_file(path: str, mapping: Dict[str, str], writer: ParallelWriter, checkpoint: Checkpoint,
+                chunk_rows: int):
+    """
+    Import a single file, keeping at most two chunks per worker in memory.
+    :param path: CSV or Parquet file
+    :param mapping: source column name -> iot_data column name
+    :param writer: parallel ILP writer
+    :param checkpoint: progress of the import
+    :param chunk_rows: rows per chunk
+    """
+    if checkpoint.is_complete(path):
+        logger.info(f"Skipping {path}, already imported.")
+        return
+
+    skip_rows = checkpoint.rows_done(path)
+    if skip_rows:
+        previous_chunk_rows = checkpoint.chunk_rows(path)
+        logger.info(f"Resuming {path} after {skip_rows} rows"
+                    + (f" (chunks of {previous_chunk_rows} rows before, {chunk_rows} now)."
+                       if previous_chunk_rows not in (None, chunk_rows) else "."))
+    checkpoint.start(path, chunk_rows)
+
+    in_flight = {}
+    max_in_flight = writer.workers * 2
+    start = time.perf_counter()
+    imported = 0
+
+    def collect(return_when):
+        nonlocal imported
+        done, _ = wait(in_flight, return_when=return_when)
+        for future in done:
+            first_row = in_flight.pop(future)
+            rows = future.result()  # Raises if the chunk could not be written, stopping the import
+            checkpoint.chunk_done(path, first_row, rows)
+            imported += rows
+        elapsed = time.perf_counter() - start
+        logger.info(f"{path}: {checkpoint.rows_done(path)} rows imported "
+                    f"({imported / elapsed:.0f} rows/s over this run).")
+
+    first_row = skip_rows
+    for chunk in read_chunks(path, list(mapping), chunk_rows, skip_rows):
+        in_flight[writer.submit(to_schema(chunk, mapping))] = first_row
+        first_row += len(chunk)
+        if len(in_flight) >= max_in_flight:
+            collect(FIRST_COMPLETED)
+
+    if in_flight:
+        collect(ALL_COMPLETED)
+    checkpoint.file_done(path)
+    logger.info(f"Imported {path} in {time.perf_counter() - start:.1f} s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import readings from CSV or Parquet files into QuestDB.")
+    parser.add_argument("files", nargs="+", help="CSV or Parquet (.parquet) files to import")
+    parser.add_argument("--map", action="append", default=[], metavar="COLUMN=SOURCE",
+                        help=f"source column of an iot_data column, can be repeated (columns: {', '.join(COLUMNS)})")
+    parser.add_argument("--conf", default=QDB_CLIENT_CONF, help="QuestDB client configuration string")
+    parser.add_argument("--table", default=TABLE_NAME, help="target table")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="rows per chunk and per transaction")
+    parser.add_argument("--workers", type=int, default=4, help="number of parallel ILP connections")
+    parser.add_argument("--checkpoint", default="bulk_import.checkpoint.json",
+                        help="progress file used to resume an interrupted import, '' to disable")
+    args = parser.parse_args()
+
+    try:
+        mapping = parse_mapping(args.map)
+    except ValueError as e:
+        parser.error(str(e))
+
+    checkpoint = Checkpoint(args.checkpoint or None)
+    writer = ParallelWriter(args.conf, args.table, args.workers)
+    try:
+        for path in args.files:
+            import_file(path, mapping, writer, checkpoint, args.chunk_rows)
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 from random import choice
 from quixstreams import Application
+from common.log import LOG_LEVEL, configure_logging
+from common.metrics import start_http_server
+from common.topics import ensure_topic, producer_config
 from synthetic_iot_data_generator import (Device, DeviceTypeOptions, FrequencyOptions, produce_data)
 
 
 #BROKER_ADDRESS = "localhost:29093" # Localhost
 BROKER_ADDRESS = "kafka1:9092,kafka2:9093,kafka3:9094"
+TOPIC_NAME = "machinery-data"
 
 
 def main():
+    configure_logging()
+    start_http_server()
 
     options = DeviceTypeOptions.list()
     locations = ["packaging", "production", "warehouse"]
@@ -15,12 +21,14 @@ def main():
     devices = [Device(device_type=choice(options),
                       location=choice(locations)) for _ in range(10)]
 
+    ensure_topic(BROKER_ADDRESS, TOPIC_NAME)
     app = Application(broker_address=BROKER_ADDRESS,
-                      loglevel="DEBUG")
+                      loglevel=LOG_LEVEL,
+                      producer_extra_config=producer_config())
 
     for device in devices:
         device_data = device.create_data_records(24*7, FrequencyOptions.hour)
-        produce_data(topic="machinery-data",
+        produce_data(topic=TOPIC_NAME,
                      device_id=device.device_id,
                      records=device_data,
                      app=app)
@@ -1,4 +1,3 @@
-import json
 import time
 
 import numpy as np
@@ -11,6 +10,8 @@ from collections import namedtuple
 from loguru import logger
 from pandas import date_range
 from quixstreams import Application
+from common.metrics import Counter, Histogram
+from common.wire_format import WIRE_FORMAT, encode
 
 
 class BaseOptions(str, Enum):
@@ -36,6 +37,11 @@ HIGH_CURRENT = (2, 20)  # 2 to 20A
 VERY_HIGH_CURRENT = (20, 100)  # 20 to 100A
 
 
+MESSAGES_PRODUCED = Counter("producer_messages", "Records handed to the Kafka producer by outcome.", ["outcome"])
+PRODUCE_RETRIES = Counter("producer_retries", "Retried produce calls.")
+PRODUCE_SECONDS = Histogram("producer_produce_seconds", "Time spent in a produce call.")
+
+
 class FrequencyOptions(BaseOptions):
     hour = "h"
 
@@ -147,7 +153,7 @@ class Device:
 #
 #     with app.get_producer() as producer:
 #         for record in records:
-#             logger.debug(f"Got record:\n\t{record}")
+#             logger.debug("Got record:\n\t{}", record)
 #
 #             producer.produce(
 #                 topic=topic,
@@ -162,7 +168,8 @@ def produce_data(topic: str,
                  records: List[Dict[str, str]],
                  app: Application,
                  max_retries: int = 3,
-                 retry_delay: float = 5.0):
+                 retry_delay: float = 5.0,
+                 wire_format: str = WIRE_FORMAT):
     """
     Produce data records for a given topic to Kafka topic with retry logic.
     :param topic: Kafka topic to push data.
@@ -171,25 +178,29 @@ def produce_data(topic: str,
     :param app: a quixstreams Application object needed to get a kafka application up.
     :param max_retries: Maximum number of retry attempts for failed messages.
     :param retry_delay: Delay (in seconds) between retries.
+    :param wire_format: encoding of the messages, see common/wire_format.py
     :return:
     """
 
     with app.get_producer() as producer:
         for record in records:
+            value, headers = encode(record, wire_format)
             retries = 0
             success = False
 
             while retries < max_retries and not success:
                 try:
-                    logger.debug(f"Got record:\n\t{record}")
+                    logger.debug("Got record:\n\t{}", record)
 
-                    producer.produce(
-                        topic=topic,
-                        key=str(device_id),
-                        value=json.dumps(record),
-                    )
+                    with PRODUCE_SECONDS.time():
+                        producer.produce(
+                            topic=topic,
+                            key=str(device_id),
+                            value=value,
+                            headers=headers,
+                        )
 
-                    logger.info(f"Payload sent to topic: {topic}")
+                    logger.debug("Payload sent to topic: {}", topic)
                     success = True  # Message sent successfully
 
                 except Exception as e:
@@ -197,7 +208,12 @@ def produce_data(topic: str,
                     logger.error(f"Error sending record to topic '{topic}': {e}")
 
                     if retries < max_retries:
+                        PRODUCE_RETRIES.inc()
                         logger.info(f"Retrying ({retries}/{max_retries}) in {retry_delay} seconds...")
                         time.sleep(retry_delay)
                     else:
-                        logger.error(f"Max retries reached. Failed to send record: {record}")
\ No newline at end of file
+                        logger.error(f"Max retries reached. Failed to send record: {record}")
+
+            MESSAGES_PRODUCED.labels("sent" if success else "failed").inc()
+
+    logger.info(f"Sent {len(records)} records of device {device_id} to topic: {topic}")
\ No newline at end of file
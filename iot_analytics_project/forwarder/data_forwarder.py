@@ -1,10 +1,16 @@
-import json
-import time
-import uuid
+import os
 import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
 import httpx
+from confluent_kafka import TopicPartition
 from quixstreams import Application
 from loguru import logger
+from common.log import LOG_LEVEL, configure_logging
+from common.metrics import Counter, Gauge, Histogram, start_http_server
+from common.topics import ensure_topic
+from common.wire_format import decode
 
 #API_URL = "http://localhost:8000/data"
 API_URL = "http://api:8000/data"
@@ -12,39 +18,178 @@ API_URL = "http://api:8000/data"
 # Kafka configuration
 BROKER_ADDRESS = "kafka1:9092,kafka2:9093,kafka3:9094"
 TOPIC_NAME = "machinery-data"
+# A stable group makes restarts resume from the committed offsets instead of replaying the whole topic
+CONSUMER_GROUP = os.getenv("CONSUMER_GROUP", "iot-data-forwarder")
+# Maximum number of messages polled before they are forwarded
+POLL_BATCH_SIZE = int(os.getenv("POLL_BATCH_SIZE", 500))
+# Individual messages are logged at DEBUG level, progress at INFO level once every LOG_EVERY messages
+LOG_EVERY = int(os.getenv("LOG_EVERY", 1000))
+
+MESSAGES_FORWARDED = Counter("forwarder_messages", "Messages forwarded to the API by outcome.", ["outcome"])
+SEND_RETRIES = Counter("forwarder_send_retries", "Retried requests to the API by reason.", ["reason"])
+SEND_SECONDS = Histogram("forwarder_send_seconds", "Latency of requests to the API.")
+POLL_BATCH_MESSAGES = Histogram("forwarder_poll_batch_messages", "Messages per polled batch.",
+                                buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+RECORD_AGE_SECONDS = Histogram("forwarder_record_age_seconds", "Time between a message being produced and polled.",
+                               buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600))
+CONSUMER_LAG = Gauge("forwarder_consumer_lag", "Messages between the last polled offset and the end of the partition.",
+                     ["partition"])
 
 # Asynchronous function to send data to the API
-async def send_to_api(data,max_retries: int = 3, retry_delay=5.0):
+async def send_to_api(client: httpx.AsyncClient, data, max_retries: int = 3, retry_delay=5.0):
     """
     Forward data from topic that we subscribe to the API
-    :param data:
-    :return:
+    :param client: HTTP client shared by all requests, so connections to the API are reused
+    :param data: payload for the API
+    :param max_retries: Maximum number of retry attempts for failed requests.
+    :param retry_delay: Delay (in seconds) between retries.
+    :return: True once the data is dealt with: accepted, or rejected as invalid by the API (4xx other than 429),
+        which sending it again would not change. False when it should be sent again later, after the retries
+        failed to reach the API or kept being answered with 429 or 5xx.
     """
-    async with httpx.AsyncClient() as client:
+    retries = 0
+    success = False
+    rejected = False
 
-        retries = 0
-        success = False
-
-        while retries < max_retries and not success:
-            try:
+    while retries < max_retries and not success:
+        try:
+            with SEND_SECONDS.time():
                 response = await client.post(API_URL, json=data)
-                response.raise_for_status()  # Raise an error for bad responses
-                logger.info(f"Data sent successfully: {data}")
-                success = True  # Message sent successfully
-            except httpx.RequestError as ex:
+            response.raise_for_status()  # Raise an error for bad responses
+            logger.debug("Data sent successfully: {}", data)
+            success = True  # Message sent successfully
+        except httpx.RequestError as ex:
+            retries += 1
+            if retries < max_retries:
+                SEND_RETRIES.labels("request_error").inc()
+                logger.error(f"Exception: {ex}")
+                logger.info(f"Retrying ({retries}/{max_retries}) in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429:
+                # The API ingest buffer is full, back off and try again
+                retries += 1
+                if retries < max_retries:
+                    SEND_RETRIES.labels("backpressure").inc()
+                    logger.warning(f"API is applying backpressure, retrying ({retries}/{max_retries}) "
+                                   f"in {retry_delay} seconds...")
+                    await asyncio.sleep(retry_delay)
+            elif e.response.status_code >= 500:
+                # E.g. the database is unavailable, the data itself may well be valid
                 retries += 1
                 if retries < max_retries:
-                    logger.error(f"Exception: {ex}")
+                    SEND_RETRIES.labels("server_error").inc()
+                    logger.error(f"HTTP error occurred: {e}")
                     logger.info(f"Retrying ({retries}/{max_retries}) in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-            except httpx.HTTPStatusError as e:
+                    await asyncio.sleep(retry_delay)
+            else:
                 logger.error(f"HTTP error occurred: {e}")
+                rejected = True
+                break
+
+    MESSAGES_FORWARDED.labels("sent" if success else "rejected" if rejected else "failed").inc()
+    return success or rejected
+
+
+def message_to_payload(msg) -> Dict[str, Any]:
+    """
+    Turn a Kafka message from the topic into the payload expected by the API.
+    The encoding of the message is taken from its headers, see common/wire_format.py
+    :param msg: message polled from the topic
+    :return: payload for the API
+    """
+    payload = decode(msg.value(), msg.headers())
+    payload["device_id"] = msg.key().decode("utf-8")
+    # Lets the API recognize messages it has already ingested
+    payload["message_id"] = f"{msg.topic()}-{msg.partition()}-{msg.offset()}"
+    return payload
+
+
+def poll_batch(consumer, max_messages: int, timeout: float = 1.0) -> List:
+    """
+    Poll up to ``max_messages`` messages, waiting at most ``timeout`` seconds for the first one only.
+    :param consumer: subscribed Kafka consumer
+    :param max_messages: maximum size of the batch
+    :param timeout: seconds to wait for the first message
+    :return: the polled messages without the ones carrying an error
+    """
+    messages = []
+    msg = consumer.poll(timeout=timeout)
+    while msg is not None:
+        if msg.error() is not None:
+            logger.error(f"Error in message: {msg.error()}")
+        else:
+            messages.append(msg)
+            if len(messages) >= max_messages:
+                break
+        msg = consumer.poll(timeout=0)
+    return messages
+
+
+def record_lag(consumer, messages: List):
+    """
+    Record how far behind the consumer is, per partition, from the watermarks cached by the client.
+    :param consumer: subscribed Kafka consumer
+    :param messages: batch of polled messages
+    """
+    now = time.time()
+    last_per_partition = {}
+    for msg in messages:
+        RECORD_AGE_SECONDS.observe(max(0.0, now - msg.timestamp()[1] / 1000))
+        last_per_partition[(msg.topic(), msg.partition())] = msg
+
+    for (topic, partition), msg in last_per_partition.items():
+        watermarks = consumer.get_watermark_offsets(TopicPartition(topic, partition), cached=True)
+        if watermarks:
+            CONSUMER_LAG.labels(partition).set(watermarks[1] - msg.offset() - 1)
+
+
+def group_by_partition(messages: List) -> List[List]:
+    """
+    Split a batch per partition, keeping the order of the messages within every partition.
+    :param messages: batch of polled messages
+    :return: one list of messages per partition
+    """
+    partitions = defaultdict(list)
+    for msg in messages:
+        partitions[(msg.topic(), msg.partition())].append(msg)
+    return list(partitions.values())
+
+
+async def forward_partition(client: httpx.AsyncClient, consumer, messages: List) -> int:
+    """
+    Forward the messages of one partition in order, so the readings of a device reach the API in order.
+    The offset of a message is only stored once the API accepted it. When a message cannot be delivered, the rest of
+    the partition is left out of this batch and the consumer is rewound to that message, so it is polled again.
+    :param client: HTTP client shared by all requests
+    :param consumer: subscribed Kafka consumer, storing the offsets of the forwarded messages
+    :param messages: messages of a single partition
+    :return: number of messages forwarded
+    """
+    for forwarded, msg in enumerate(messages):
+        data = message_to_payload(msg)
+
+        logger.debug("Received message {}/{} {}: {}", msg.partition(), msg.offset(), data["device_id"], data)
+
+        # Send the data asynchronously to the API
+        if not await send_to_api(client, data):
+            logger.error(f"Could not forward message {msg.partition()}/{msg.offset()}, "
+                         f"retrying partition {msg.partition()} from it.")
+            consumer.seek(TopicPartition(msg.topic(), msg.partition(), msg.offset()))
+            return forwarded
+
+        consumer.store_offsets(msg)
+    return len(messages)
+
 
 # Main async function for consuming Kafka messages
 async def main():
+    configure_logging()
+    start_http_server()
+    ensure_topic(BROKER_ADDRESS, TOPIC_NAME)
     app = Application(broker_address=BROKER_ADDRESS,
-                      loglevel="DEBUG",
-                      consumer_group=str(uuid.uuid4()),
+                      loglevel=LOG_LEVEL,
+                      consumer_group=CONSUMER_GROUP,
                       auto_offset_reset='earliest',
                       )
 
@@ -52,32 +197,25 @@ async def main():
         consumer.subscribe([TOPIC_NAME])
         logger.info(f"Subscribed to Kafka topic: {TOPIC_NAME}")
 
-        while True:
-            msg = consumer.poll(timeout=1)
+        forwarded = 0
+        async with httpx.AsyncClient() as client:
+            while True:
+                batch = poll_batch(consumer, POLL_BATCH_SIZE)
 
-            if msg is None:
-                logger.info("Waiting for message...")
-            elif msg.error() is not None:
-                logger.error(f"Error in message: {msg.error()}")
-            else:
-                key = msg.key().decode("utf-8")
-                value = json.loads(msg.value())
-                offset = msg.offset()
-
-                logger.info(f"Received message {offset} {key}: {value}")
-                consumer.store_offsets(msg)
-
-                data = {
-                    "device_id": key,
-                    "device_type": value.get("device_type"),
-                    "timestamp": value.get("timestamp"),
-                    "current": value.get("current"),
-                    "voltage": value.get("voltage"),
-                    "location": value.get("location")
-                }
-
-                # Send the data asynchronously to the API
-                await send_to_api(data)
+                if not batch:
+                    logger.info("Waiting for message...")
+                    continue
+
+                POLL_BATCH_MESSAGES.observe(len(batch))
+                record_lag(consumer, batch)
+
+                # Partitions are forwarded concurrently, the messages of a partition one after the other
+                counts = await asyncio.gather(*(forward_partition(client, consumer, messages)
+                                                for messages in group_by_partition(batch)))
+
+                previous, forwarded = forwarded, forwarded + sum(counts)
+                if forwarded // LOG_EVERY > previous // LOG_EVERY:
+                    logger.info(f"Forwarded {forwarded} messages so far")
 
 # Start the async event loop
 if __name__ == '__main__':
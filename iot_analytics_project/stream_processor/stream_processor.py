@@ -0,0 +1,248 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+from loguru import logger
+from questdb.ingress import IngressError, Sender, TimestampNanos
+from quixstreams import Application
+from quixstreams.models.serializers import Deserializer
+from quixstreams.sinks import BatchingSink, SinkBackpressureError, SinkBatch
+from common.log import LOG_LEVEL, configure_logging
+from common.metrics import Counter, start_http_server
+from common.topics import ensure_topic, producer_config
+from common.wire_format import decode, to_epoch_ms
+
+#BROKER_ADDRESS = "localhost:29093" # Localhost
+BROKER_ADDRESS = "kafka1:9092,kafka2:9093,kafka3:9094"
+TOPIC_NAME = "machinery-data"
+DERIVED_TOPIC_NAME = "machinery-data-derived"
+CONSUMER_GROUP = os.getenv("CONSUMER_GROUP", "iot-stream-processor")
+
+# Connection string of the QuestDB client, see https://questdb.io/docs/configuration-string/
+QDB_CLIENT_CONF = os.getenv("QDB_CLIENT_CONF", "http::addr=questdb:9000;")
+DERIVED_TABLE = "iot_derived"
+
+TUMBLING_WINDOW_MINUTES = int(os.getenv("TUMBLING_WINDOW_MINUTES", 60))
+HOPPING_WINDOW_MINUTES = int(os.getenv("HOPPING_WINDOW_MINUTES", 24 * 60))
+HOPPING_STEP_MINUTES = int(os.getenv("HOPPING_STEP_MINUTES", 6 * 60))
+# Readings arriving this late are still added to their window, which is only emitted afterwards
+WINDOW_GRACE_MINUTES = int(os.getenv("WINDOW_GRACE_MINUTES", 5))
+# A gap longer than this between two readings of a device is not integrated, e.g. the device was off
+MAX_INTEGRATION_GAP_MINUTES = int(os.getenv("MAX_INTEGRATION_GAP_MINUTES", 6 * 60))
+
+READINGS_PROCESSED = Counter("stream_processor_readings", "Readings processed.")
+WINDOWS_EMITTED = Counter("stream_processor_windows", "Window aggregates emitted by window.", ["window"])
+SINK_ROWS = Counter("stream_processor_sink_rows", "Rows written to QuestDB by outcome.", ["outcome"])
+
+
+class WireFormatDeserializer(Deserializer):
+    """Decodes readings in whichever encoding their headers name, see common/wire_format.py"""
+
+    def __call__(self, value: bytes, ctx) -> Dict[str, Any]:
+        return decode(value, ctx.headers)
+
+
+def reading_timestamp(value: Dict[str, Any], headers, timestamp: int, timestamp_type) -> int:
+    """Windows follow the time the reading was taken, not the time it was produced."""
+    return to_epoch_ms(value["timestamp"])
+
+
+def with_power(reading: Dict[str, Any], key: str, timestamp: int, headers) -> Dict[str, Any]:
+    """
+    Add the device id and the power (P = V * I, in W) to a reading.
+    :param reading: decoded reading
+    :param key: device id, the key of the message
+    :param timestamp: time of the reading in milliseconds since the epoch
+    :param headers: message headers
+    :return: the reading with device_id, timestamp_ms and power
+    """
+    READINGS_PROCESSED.inc()
+    return dict(reading, device_id=key, timestamp_ms=timestamp, power=reading["voltage"] * reading["current"])
+
+
+def integrate_energy(reading: Dict[str, Any], state) -> Dict[str, Any]:
+    """
+    Integrate power over the real time elapsed since the previous reading of the device, with the trapezoidal rule.
+    The previous reading and the running total are kept in the state of the device.
+    :param reading: reading with power and timestamp_ms
+    :param state: state of the device (the message key)
+    :return: the reading with energy_wh, the energy since the previous reading, and energy_total_wh
+    """
+    previous = state.get("previous")
+    energy_wh = 0.0
+    if previous is not None:
+        hours = (reading["timestamp_ms"] - previous["timestamp_ms"]) / 3_600_000
+        # Readings out of order or after a long gap are not integrated
+        if 0 < hours <= MAX_INTEGRATION_GAP_MINUTES / 60:
+            energy_wh = (previous["power"] + reading["power"]) / 2 * hours
+
+    if previous is None or reading["timestamp_ms"] > previous["timestamp_ms"]:
+        state.set("previous", {"timestamp_ms": reading["timestamp_ms"], "power": reading["power"]})
+
+    energy_total_wh = state.get("energy_total_wh", 0.0) + energy_wh
+    state.set("energy_total_wh", energy_total_wh)
+    return dict(reading, energy_wh=energy_wh, energy_total_wh=energy_total_wh)
+
+
+def init_window(reading: Dict[str, Any]) -> Dict[str, Any]:
+    """First reading of a window."""
+    return {
+        "device_id": reading["device_id"],
+        "readings": 1,
+        "voltage_sum": reading["voltage"],
+        "current_sum": reading["current"],
+        "power_sum": reading["power"],
+        "max_power": reading["power"],
+        "energy_wh": reading["energy_wh"],
+        "energy_total_wh": reading["energy_total_wh"],
+    }
+
+
+def reduce_window(aggregate: Dict[str, Any], reading: Dict[str, Any]) -> Dict[str, Any]:
+    """Add a reading to the aggregate of its window."""
+    return {
+        "device_id": aggregate["device_id"],
+        "readings": aggregate["readings"] + 1,
+        "voltage_sum": aggregate["voltage_sum"] + reading["voltage"],
+        "current_sum": aggregate["current_sum"] + reading["current"],
+        "power_sum": aggregate["power_sum"] + reading["power"],
+        "max_power": max(aggregate["max_power"], reading["power"]),
+        "energy_wh": aggregate["energy_wh"] + reading["energy_wh"],
+        "energy_total_wh": max(aggregate["energy_total_wh"], reading["energy_total_wh"]),
+    }
+
+
+def window_record(window: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Turn the result of a window into a derived record.
+    :param window: name of the window, e.g. "1h" or "24h/6h" for hopping windows
+    """
+    def to_record(result: Dict[str, Any]) -> Dict[str, Any]:
+        aggregate = result["value"]
+        WINDOWS_EMITTED.labels(window).inc()
+        return {
+            "device_id": aggregate["device_id"],
+            "window": window,
+            "window_start": result["start"],
+            "window_end": result["end"],
+            "readings": aggregate["readings"],
+            "mean_voltage": aggregate["voltage_sum"] / aggregate["readings"],
+            "mean_current": aggregate["current_sum"] / aggregate["readings"],
+            "mean_power": aggregate["power_sum"] / aggregate["readings"],
+            "max_power": aggregate["max_power"],
+            "energy_wh": aggregate["energy_wh"],
+            "energy_total_wh": aggregate["energy_total_wh"],
+        }
+    return to_record
+
+
+def window_name(duration_minutes: int, step_minutes: Optional[int] = None) -> str:
+    def minutes(value: int) -> str:
+        return f"{value // 60}h" if value % 60 == 0 else f"{value}m"
+
+    return minutes(duration_minutes) if step_minutes is None else f"{minutes(duration_minutes)}/{minutes(step_minutes)}"
+
+
+class QuestDBSink(BatchingSink):
+    """
+    Writes derived records to QuestDB over InfluxDB Line Protocol, one transaction per batch.
+    The table is created by the API with dedup keys, so batches replayed after a restart overwrite their rows.
+    """
+
+    def __init__(self, conf: str = QDB_CLIENT_CONF, table: str = DERIVED_TABLE):
+        super().__init__()
+        self.conf = conf
+        self.table = table
+        self._sender: Optional[Sender] = None
+
+    def write(self, batch: SinkBatch):
+        try:
+            if self._sender is None:
+                self._sender = Sender.from_conf(self.conf)
+                self._sender.establish()
+
+            for item in batch:
+                record = item.value
+                self._sender.row(
+                    self.table,
+                    symbols={"device_id": record["device_id"], "window_size": record["window"]},
+                    columns={
+                        "window_end": datetime.fromtimestamp(record["window_end"] / 1000, tz=timezone.utc),
+                        "readings": record["readings"],
+                        "mean_voltage": record["mean_voltage"],
+                        "mean_current": record["mean_current"],
+                        "mean_power": record["mean_power"],
+                        "max_power": record["max_power"],
+                        "energy_wh": record["energy_wh"],
+                        "energy_total_wh": record["energy_total_wh"],
+                    },
+                    at=TimestampNanos(record["window_start"] * 1_000_000),
+                )
+            self._sender.flush()
+            SINK_ROWS.labels("written").inc(batch.size)
+        except IngressError as e:
+            SINK_ROWS.labels("retried").inc(batch.size)
+            logger.error(f"Writing {batch.size} derived records failed, retrying: {e}")
+            if self._sender is not None:
+                self._sender.close(flush=False)
+                self._sender = None
+            raise SinkBackpressureError(retry_after=10, topic=batch.topic, partition=batch.partition)
+
+
+def build_pipeline(app: Application):
+    """
+    Derive power, energy and per device window aggregates from the readings, publish the aggregates
+    to the derived topic and store them in QuestDB.
+    :param app: quixstreams application consuming the readings
+    :return: the StreamingDataFrame of the readings
+    """
+    readings = app.topic(TOPIC_NAME, key_deserializer="str", value_deserializer=WireFormatDeserializer(),
+                         timestamp_extractor=reading_timestamp)
+    derived = app.topic(DERIVED_TOPIC_NAME, key_serializer="str", value_serializer="json")
+    sink = QuestDBSink()
+
+    sdf = app.dataframe(readings)
+    sdf = sdf.apply(with_power, metadata=True)
+    sdf = sdf.apply(integrate_energy, stateful=True)
+
+    grace = timedelta(minutes=WINDOW_GRACE_MINUTES)
+    tumbling = (
+        sdf.tumbling_window(timedelta(minutes=TUMBLING_WINDOW_MINUTES), grace_ms=grace)
+        .reduce(reducer=reduce_window, initializer=init_window)
+        .final()
+        .apply(window_record(window_name(TUMBLING_WINDOW_MINUTES)))
+    )
+    hopping = (
+        sdf.hopping_window(timedelta(minutes=HOPPING_WINDOW_MINUTES), timedelta(minutes=HOPPING_STEP_MINUTES),
+                           grace_ms=grace)
+        .reduce(reducer=reduce_window, initializer=init_window)
+        .final()
+        .apply(window_record(window_name(HOPPING_WINDOW_MINUTES, HOPPING_STEP_MINUTES)))
+    )
+
+    for windows in (tumbling, hopping):
+        windows = windows.to_topic(derived)
+        windows.sink(sink)
+    return sdf
+
+
+def main():
+    configure_logging()
+    start_http_server()
+    # The readings topic is created here too in case this service starts before the generator: quixstreams would
+    # otherwise create it with a single partition, leaving one partition to consume in parallel
+    ensure_topic(BROKER_ADDRESS, TOPIC_NAME)
+    # Same partitioning as the readings, so the derived records of a device stay in order as well
+    ensure_topic(BROKER_ADDRESS, DERIVED_TOPIC_NAME)
+    app = Application(broker_address=BROKER_ADDRESS,
+                      loglevel=LOG_LEVEL,
+                      consumer_group=CONSUMER_GROUP,
+                      auto_offset_reset="earliest",
+                      producer_extra_config=producer_config(),
+                      )
+    build_pipeline(app)
+    logger.info(f"Deriving {TOPIC_NAME} into {DERIVED_TOPIC_NAME} and QuestDB table {DERIVED_TABLE}.")
+    app.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+# Puts the service directories on sys.path, the tests import the services the same way as the benchmarks
+import benchmarks  # noqa: F401
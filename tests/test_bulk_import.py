@@ -0,0 +1,90 @@
+from concurrent.futures import Future
+
+import pandas as pd
+import pytest
+
+from bulk_import import COLUMNS, Checkpoint, import_file, parse_mapping, read_chunks
+
+ROWS = 10
+
+
+class RecordingWriter:
+    """Stands in for ``ParallelWriter``, keeping the device ids written and failing the chunk at ``fail_at``."""
+
+    workers = 1
+
+    def __init__(self, fail_at: int = None):
+        self.device_ids = []
+        self.fail_at = fail_at
+        self.chunks = 0
+
+    def submit(self, chunk: pd.DataFrame) -> Future:
+        future = Future()
+        if self.chunks == self.fail_at:
+            future.set_exception(ConnectionError("QuestDB unavailable"))
+        else:
+            self.device_ids.extend(chunk["device_id"])
+            future.set_result(len(chunk))
+        self.chunks += 1
+        return future
+
+
+@pytest.fixture(params=["csv", "parquet"])
+def source(request, tmp_path):
+    frame = pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=ROWS, freq="min"),
+        "device_id": [f"device_{i}" for i in range(ROWS)],
+        "voltage": 230.0,
+        "current": 1.5,
+        "device_type": "Sensor",
+        "location": "production",
+    })
+    path = str(tmp_path / f"readings.{request.param}")
+    if request.param == "csv":
+        frame.to_csv(path, index=False)
+    else:
+        frame.to_parquet(path, index=False)
+    return path
+
+
+def test_read_chunks_skips_imported_rows(source):
+    chunks = list(read_chunks(source, COLUMNS, chunk_rows=4, skip_rows=6))
+    assert all(len(chunk) <= 4 for chunk in chunks)
+    assert list(pd.concat(chunks)["device_id"]) == [f"device_{i}" for i in range(6, ROWS)]
+
+
+def test_checkpoint_records_contiguous_rows_only(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path)
+    checkpoint.start("a.csv", chunk_rows=3)
+    checkpoint.chunk_done("a.csv", first_row=3, rows=3)
+    assert checkpoint.rows_done("a.csv") == 0
+    checkpoint.chunk_done("a.csv", first_row=0, rows=3)
+    assert checkpoint.rows_done("a.csv") == 6
+
+    reloaded = Checkpoint(path)
+    assert reloaded.rows_done("a.csv") == 6
+    assert reloaded.chunk_rows("a.csv") == 3
+    assert not reloaded.is_complete("a.csv")
+
+
+def test_resume_with_another_chunk_size_starts_after_recorded_rows(source, tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    mapping = parse_mapping([])
+
+    interrupted = RecordingWriter(fail_at=2)
+    with pytest.raises(ConnectionError):
+        import_file(source, mapping, interrupted, Checkpoint(checkpoint_path), chunk_rows=3)
+    assert Checkpoint(checkpoint_path).rows_done(source) == 6
+
+    resumed = RecordingWriter()
+    checkpoint = Checkpoint(checkpoint_path)
+    import_file(source, mapping, resumed, checkpoint, chunk_rows=4)
+    # Chunks written after the failed one are not recorded, the resumed import sends them again
+    assert interrupted.device_ids[:6] == [f"device_{i}" for i in range(6)]
+    assert resumed.device_ids == [f"device_{i}" for i in range(6, ROWS)]
+    assert checkpoint.is_complete(source)
+
+    skipped = RecordingWriter()
+    import_file(source, mapping, skipped, Checkpoint(checkpoint_path), chunk_rows=4)
+    assert skipped.device_ids == []
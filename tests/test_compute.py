@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from compute import AnomalyCompute, AnomalyKey
+
+TIME_SERIES = pd.Series([1.0, 2.0, 50.0, 2.0], index=pd.date_range("2024-01-01", periods=4, freq="h"))
+KEY = AnomalyKey("device_1", "voltage", "value_based", 0.0, 10.0, (4, None))
+
+
+class GatedExecutor(ThreadPoolExecutor):
+    """Runs the detections in threads, each one only once ``gate`` is set."""
+
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.gate = threading.Event()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        def gated():
+            self.gate.wait()
+            return fn(*args, **kwargs)
+
+        return super().submit(gated)
+
+
+def test_result_calls_on_wait_until_the_detection_is_done():
+    executor = GatedExecutor()
+    compute = AnomalyCompute(executor)
+    waited = []
+
+    def on_wait(seconds: float):
+        waited.append(seconds)
+        if len(waited) == 3:
+            executor.gate.set()
+
+    future = compute.submit(KEY, TIME_SERIES)
+    anomalies = compute.result(KEY, TIME_SERIES, future, poll_seconds=0.01, on_wait=on_wait)
+    executor.shutdown()
+
+    assert list(anomalies) == [False, False, True, False]
+    assert len(waited) >= 3 and waited == sorted(waited)
+
+
+def test_result_resubmits_cancelled_detections():
+    executor = ThreadPoolExecutor(max_workers=1)
+    compute = AnomalyCompute(executor)
+    cancelled = Future()
+    cancelled.cancel()
+
+    anomalies = compute.result(KEY, TIME_SERIES, cancelled)
+    executor.shutdown()
+    assert isinstance(anomalies, np.ndarray) and anomalies.sum() == 1
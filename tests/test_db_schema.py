@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from db import db_connection
+from db.db_connection import LEGACY_TABLE, MIGRATION_TABLE, init_db
+
+
+class SchemaConnection:
+    """Records the statements executed, describing ``iot_data`` with the given ``tables()`` row."""
+
+    def __init__(self, designated_timestamp, wal_enabled: bool):
+        self.table = {"designatedTimestamp": designated_timestamp, "walEnabled": wal_enabled}
+        self.statements = []
+
+    async def fetchrow(self, query: str, *args):
+        return self.table
+
+    async def execute(self, query: str, *args):
+        self.statements.append(" ".join(query.split()))
+        return "OK"
+
+
+class SchemaPool:
+    def __init__(self, connection: SchemaConnection):
+        self.connection = connection
+
+    async def acquire(self):
+        return self.connection
+
+    async def release(self, connection):
+        pass
+
+
+@pytest.fixture
+def connect(monkeypatch, tmp_path):
+    monkeypatch.setattr(db_connection, "SCHEMA_LOCK_FILE", str(tmp_path / "schema.lock"))
+
+    def connect(designated_timestamp, wal_enabled):
+        connection = SchemaConnection(designated_timestamp, wal_enabled)
+        monkeypatch.setattr(db_connection, "_pool", SchemaPool(connection))
+        return connection
+
+    return connect
+
+
+def test_current_table_is_not_migrated(connect):
+    connection = connect("timestamp", True)
+    asyncio.run(init_db())
+    assert not any(MIGRATION_TABLE in statement for statement in connection.statements)
+    assert "ALTER TABLE iot_data DEDUP ENABLE UPSERT KEYS(timestamp, device_id)" in connection.statements
+
+
+def test_legacy_table_is_copied_and_replaced(connect):
+    connection = connect(None, False)
+    asyncio.run(init_db())
+    migration = [statement for statement in connection.statements
+                 if MIGRATION_TABLE in statement or LEGACY_TABLE in statement]
+    assert [statement.split(" (")[0] for statement in migration] == [
+        f"DROP TABLE IF EXISTS {MIGRATION_TABLE}",
+        f"CREATE TABLE {MIGRATION_TABLE}",
+        f"INSERT INTO {MIGRATION_TABLE}",
+        f"RENAME TABLE iot_data TO {LEGACY_TABLE}",
+        f"RENAME TABLE {MIGRATION_TABLE} TO iot_data",
+    ]
+    assert "timestamp(timestamp) PARTITION BY DAY WAL DEDUP UPSERT KEYS(timestamp, device_id)" in migration[1]
+
+
+def test_failed_migration_stops_startup(connect):
+    connection = connect(None, False)
+
+    async def execute(query: str, *args):
+        if query.startswith("RENAME"):
+            raise RuntimeError(f"table already exists [table={LEGACY_TABLE}]")
+
+    connection.execute = execute
+    with pytest.raises(RuntimeError):
+        asyncio.run(init_db())
@@ -0,0 +1,51 @@
+import asyncio
+from collections import OrderedDict
+
+from benchmarks.stand_ins import FakePool, api_client
+from db.dedup import RecentKeys, recent_keys
+
+
+def test_add_reports_hit_and_miss():
+    keys = RecentKeys(capacity=10)
+    assert keys.add("message-1") is True
+    assert keys.add("message-1") is False
+    assert "message-1" in keys
+    assert "message-2" not in keys
+
+
+def test_capacity_evicts_least_recently_seen_key():
+    keys = RecentKeys(capacity=2)
+    keys.add("a")
+    keys.add("b")
+    # Seeing "a" again makes "b" the oldest key
+    keys.add("a")
+    keys.add("c")
+    assert len(keys) == 2
+    assert "a" in keys and "c" in keys
+    assert "b" not in keys
+
+
+def test_discard_forgets_key():
+    keys = RecentKeys(capacity=10)
+    keys.add("a")
+    keys.discard("a")
+    keys.discard("missing")
+    assert "a" not in keys
+    assert keys.add("a") is True
+
+
+def test_replayed_reading_is_acknowledged_without_being_written(monkeypatch):
+    # Keep the keys of this test out of the module-wide set
+    monkeypatch.setattr(recent_keys, "_keys", OrderedDict())
+    first = {"device_id": "device_1", "timestamp": "2024-01-01T12:00:00+02:00", "voltage": 230.0, "current": 1.5,
+             "device_type": "sensor", "location": "lab"}
+    # Same instant in another offset, stored under the same naive UTC timestamp
+    replay = dict(first, timestamp="2024-01-01T10:00:00+00:00")
+    pool = FakePool()
+
+    async def scenario():
+        async with api_client(pool) as client:
+            return [(await client.post("/data", json=reading)).status_code for reading in (first, replay)]
+
+    assert asyncio.run(scenario()) == [202, 200]
+    assert len(pool.rows) == 1
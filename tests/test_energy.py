@@ -0,0 +1,138 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import stream_processor
+import utils
+from benchmarks.stand_ins import InMemoryState
+
+HOUR_MS = 3_600_000
+START = datetime(2024, 1, 1)
+
+
+def readings(count: int, every: timedelta, power: float = 1000.0) -> pd.DataFrame:
+    """Readings at constant power, ``every`` apart from START."""
+    return pd.DataFrame({"timestamp": [(START + i * every).isoformat() for i in range(count)], "power": power})
+
+
+def test_constant_power_gives_power_times_duration():
+    # 1 kW for the 3 hours between the first and the last reading
+    assert utils.integrate_energy(readings(13, timedelta(minutes=15))) == pytest.approx(3.0)
+
+
+def test_readings_out_of_order_are_sorted():
+    df = readings(4, timedelta(hours=1))
+    assert utils.integrate_energy(df.iloc[[2, 0, 3, 1]]) == pytest.approx(3.0)
+
+
+def test_trapezoidal_rule_between_different_powers():
+    df = pd.DataFrame({"timestamp": [START.isoformat(), (START + timedelta(hours=2)).isoformat()],
+                       "power": [1000.0, 3000.0]})
+    assert utils.integrate_energy(df) == pytest.approx(4.0)
+
+
+def test_gaps_longer_than_the_limit_are_not_integrated(monkeypatch):
+    monkeypatch.setattr(utils, "MAX_INTEGRATION_GAP_MINUTES", 90)
+    df = pd.concat([readings(2, timedelta(hours=1)),
+                    readings(2, timedelta(hours=1)).assign(
+                        timestamp=[(START + timedelta(hours=h)).isoformat() for h in (5, 6)])])
+    # 0 -> 1 h and 5 -> 6 h, the 4 hours in between are a gap
+    assert utils.integrate_energy(df) == pytest.approx(2.0)
+
+
+def test_window_energy_is_used_and_only_readings_outside_are_integrated():
+    df = readings(5, timedelta(hours=1))
+    # The windows cover [1 h, 3 h) and claim more energy than the readings, to tell both apart
+    windows = [{"window_start": (START + timedelta(hours=h)).isoformat(),
+                "window_end": (START + timedelta(hours=h + 1)).isoformat(), "energy_wh": 5000.0} for h in (1, 2)]
+    # Intervals are counted with the reading ending them, at 1, 2, 3 and 4 h: the first two fall in the windows,
+    # the window end is exclusive so the ones ending at 3 h and 4 h are integrated
+    assert utils.integrate_energy(df, windows) == pytest.approx(10.0 + 2.0)
+
+
+def derive(timestamps_ms, power: float = 1000.0):
+    """Run readings through the energy integration of the stream processor."""
+    state = InMemoryState()
+    return [stream_processor.integrate_energy({"timestamp_ms": ts, "power": power}, state) for ts in timestamps_ms]
+
+
+def test_stream_processor_integrates_constant_power():
+    derived = derive(range(0, 3 * HOUR_MS + 1, HOUR_MS // 4))
+    assert derived[0]["energy_wh"] == 0
+    assert all(reading["energy_wh"] == pytest.approx(250.0) for reading in derived[1:])
+    assert derived[-1]["energy_total_wh"] == pytest.approx(3000.0)
+
+
+def test_stream_processor_skips_late_readings_and_gaps(monkeypatch):
+    monkeypatch.setattr(stream_processor, "MAX_INTEGRATION_GAP_MINUTES", 90)
+    derived = derive([0, HOUR_MS, HOUR_MS // 2, 5 * HOUR_MS, 6 * HOUR_MS])
+    assert [reading["energy_wh"] for reading in derived] == pytest.approx([0, 1000.0, 0, 0, 1000.0])
+
+
+def aggregate(readings_, window_ms: int, step_ms: int):
+    """
+    Fold readings into windows the way quixstreams assigns them: every window [start, start + window_ms)
+    with start a multiple of step_ms that contains the timestamp, tumbling when step_ms == window_ms.
+    """
+    windows = defaultdict(list)
+    for reading in readings_:
+        last_start = reading["timestamp_ms"] - reading["timestamp_ms"] % step_ms
+        for start in range(last_start, reading["timestamp_ms"] - window_ms, -step_ms):
+            windows[start].append(reading)
+
+    result = {}
+    for start, members in sorted(windows.items()):
+        value = stream_processor.init_window(members[0])
+        for reading in members[1:]:
+            value = stream_processor.reduce_window(value, reading)
+        result[start] = stream_processor.window_record("test")(
+            {"start": start, "end": start + window_ms, "value": value})
+    return result
+
+
+def window_readings(timestamps_ms):
+    return [dict(reading, device_id="device_1", voltage=230.0, current=1000.0 / 230.0)
+            for reading in derive(timestamps_ms)]
+
+
+def test_tumbling_windows_partition_the_energy():
+    # Every 30 minutes for 3 hours, a reading exactly on every window boundary
+    derived = window_readings(range(0, 3 * HOUR_MS + 1, HOUR_MS // 2))
+    windows = aggregate(derived, HOUR_MS, HOUR_MS)
+
+    assert list(windows) == [0, HOUR_MS, 2 * HOUR_MS, 3 * HOUR_MS]
+    # A reading on a boundary starts the next window and carries the interval ending at it
+    assert [window["readings"] for window in windows.values()] == [2, 2, 2, 1]
+    assert [window["energy_wh"] for window in windows.values()] == pytest.approx([500.0, 1000.0, 1000.0, 500.0])
+    assert sum(window["energy_wh"] for window in windows.values()) == pytest.approx(derived[-1]["energy_total_wh"])
+    assert windows[2 * HOUR_MS]["mean_power"] == pytest.approx(1000.0)
+    assert windows[2 * HOUR_MS]["energy_total_wh"] == pytest.approx(2500.0)
+
+
+def test_hopping_windows_overlap():
+    derived = window_readings(range(0, 4 * HOUR_MS, HOUR_MS // 2))
+    windows = aggregate(derived, 2 * HOUR_MS, HOUR_MS)
+
+    # Every reading is in two windows, their energy cannot be added up for a total
+    assert sum(window["readings"] for window in windows.values()) == 2 * len(derived)
+    assert windows[HOUR_MS]["energy_wh"] == pytest.approx(2000.0)
+
+
+@pytest.mark.parametrize("duration, step, name", [(60, None, "1h"), (90, None, "90m"), (1440, 360, "24h/6h")])
+def test_window_name(duration, step, name):
+    assert stream_processor.window_name(duration, step) == name
+
+
+def test_statistics_match_pandas_describe():
+    data = [{"timestamp": (START + timedelta(hours=i)).isoformat(), "voltage": 220.0 + i % 7, "current": 1.0 + i % 3}
+            for i in range(48)]
+    summary = utils.calculate_statistics(data).set_index("Metric")
+    expected = pd.DataFrame(data)["voltage"].describe()
+    assert list(summary.loc[["Mean", "Standard Deviation", "Minimum", "Maximum", "Median"], "Voltage"]) == \
+        pytest.approx([expected[stat] for stat in ("mean", "std", "min", "max", "50%")])
+    # Hourly readings, every interval lasts one hour
+    power = pd.DataFrame(data).eval("voltage * current")
+    assert summary.loc["Total Energy (kWh)", "Power"] == pytest.approx(
+        ((power + power.shift()) / 2).sum() / 1000)
@@ -0,0 +1,86 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from benchmarks.stand_ins import FakeConnection, FakePool, api_client
+from db import latest as latest_module
+from db.latest import LatestReadings, latest_readings
+
+READING = {"device_id": "device_1", "timestamp": "2024-01-01T12:00:00", "voltage": 230.0, "current": 1.5,
+           "device_type": "Sensor", "location": "production"}
+
+
+class LegacyConnection(FakeConnection):
+    """Fails LATEST ON queries, like a table without a designated timestamp."""
+
+    async def fetch(self, query: str, *args):
+        if "LATEST ON" in query:
+            raise RuntimeError("LATEST ON requires a designated timestamp")
+        return await super().fetch(query, *args)
+
+
+class LegacyPool(FakePool):
+    def __init__(self):
+        super().__init__()
+        self._connection = LegacyConnection(self.rows)
+
+
+def acquire_from(pool: FakePool):
+    @asynccontextmanager
+    async def acquire():
+        yield await pool.acquire()
+
+    return acquire
+
+
+@pytest.fixture(autouse=True)
+def fresh_latest_readings(monkeypatch):
+    monkeypatch.setattr(latest_readings, "_readings", {})
+    monkeypatch.setattr(latest_readings, "synced_at", None)
+
+
+def test_snapshot_is_served_as_stale_when_resync_fails():
+    async def scenario():
+        async with api_client(LegacyPool()) as client:
+            before = await client.get("/devices/latest")
+            await client.post("/data", json=READING)
+            after = await client.get("/devices/latest")
+            return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before.status_code == 503
+    assert after.status_code == 200
+    assert after.headers["X-Stale"] == "true"
+    assert [reading["device_id"] for reading in after.json()] == ["device_1"]
+
+
+def test_synced_snapshot_is_not_stale():
+    async def scenario():
+        async with api_client(FakePool()) as client:
+            await client.post("/data", json=READING)
+            return await client.get("/devices/latest")
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert "X-Stale" not in response.headers
+
+
+def test_failed_resync_is_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(latest_module, "LATEST_RETRY_INITIAL_DELAY", 0.01)
+    pool = LegacyPool()
+    monkeypatch.setattr(latest_module, "acquire", acquire_from(pool))
+
+    async def scenario():
+        readings = LatestReadings(resync_interval_seconds=60)
+        await readings.start()
+        assert not readings.synced
+        # The database recovers, e.g. once the table has been migrated
+        pool._connection = FakeConnection(pool.rows)
+        await asyncio.sleep(0.1)
+        await readings.stop()
+        return readings
+
+    readings = asyncio.run(scenario())
+    assert readings.synced and not readings.stale
+
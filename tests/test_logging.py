@@ -0,0 +1,70 @@
+import asyncio
+import sys
+
+import httpx
+import pytest
+from loguru import logger
+
+from benchmarks.stand_ins import InMemoryApplication, InMemoryBroker
+from common.log import configure_logging
+from common.wire_format import encode
+from data_forwarder import TOPIC_NAME, forward_partition
+from synthetic_iot_data_generator import Device, FrequencyOptions, produce_data
+
+MESSAGES = 50
+
+
+class StoringConsumer:
+    def __init__(self):
+        self.stored = []
+
+    def store_offsets(self, msg):
+        self.stored.append(msg.offset())
+
+
+@pytest.fixture
+def log_level(capsys):
+    # Sinks are added once capsys replaced stderr, so they write into the captured stream
+    yield configure_logging
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+def produce(broker: InMemoryBroker):
+    device = Device(location="production", device_type="Sensor")
+    produce_data(TOPIC_NAME, device.device_id, device.create_data_records(MESSAGES, FrequencyOptions.hour),
+                 InMemoryApplication(broker))
+
+
+def test_forwarder_logs_nothing_per_message_by_default(log_level, capsys):
+    log_level()
+    broker = InMemoryBroker()
+    device = Device(location="production", device_type="Sensor")
+    messages = [broker.append(TOPIC_NAME, device.device_id, *encode(record))
+                for record in device.create_data_records(MESSAGES, FrequencyOptions.hour)]
+    consumer = StoringConsumer()
+
+    async def scenario():
+        transport = httpx.MockTransport(lambda request: httpx.Response(202, json={"message": "Data accepted"}))
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await forward_partition(client, consumer, messages)
+
+    assert asyncio.run(scenario()) == MESSAGES
+    assert len(consumer.stored) == MESSAGES
+    assert capsys.readouterr().err == ""
+
+
+def test_generator_logs_one_line_per_device_by_default(log_level, capsys):
+    log_level()
+    broker = InMemoryBroker()
+    produce(broker)
+
+    assert broker.size(TOPIC_NAME) == MESSAGES
+    lines = capsys.readouterr().err.splitlines()
+    assert len(lines) == 1 and f"Sent {MESSAGES} records" in lines[0]
+
+
+def test_debug_level_logs_every_message(log_level, capsys):
+    log_level("DEBUG")
+    produce(InMemoryBroker())
+    assert capsys.readouterr().err.count("Payload sent to topic") == MESSAGES
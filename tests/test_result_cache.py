@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+
+from routes import cache as cache_module
+from routes.aggregates import default_end
+from routes.cache import ResultCache
+
+JANUARY = (datetime(2024, 1, 1), datetime(2024, 2, 1))
+FEBRUARY = (datetime(2024, 2, 1), datetime(2024, 3, 1))
+
+
+def row(timestamp: datetime, device_id: str) -> tuple:
+    return timestamp, device_id, 230.0, 1.5, "Sensor", "production"
+
+
+@pytest.fixture
+def cache() -> ResultCache:
+    cache = ResultCache(max_bytes=1024, open_ttl_seconds=5, closed_ttl_seconds=600)
+    cache.put("derived", "device_1-january", b"1", device_id="device_1", window=JANUARY, closed=True)
+    cache.put("derived", "device_1-february", b"2", device_id="device_1", window=FEBRUARY, closed=True)
+    cache.put("derived", "device_2-january", b"3", device_id="device_2", window=JANUARY, closed=True)
+    cache.put("aggregates", "january", b"4", window=JANUARY, closed=True)
+    cache.put("aggregates", "february", b"5", window=FEBRUARY, closed=True)
+    cache.put("data", "all", b"6")
+    return cache
+
+
+def test_invalidate_drops_entries_of_written_device_and_window(cache):
+    cache.invalidate([row(datetime(2024, 1, 15), "device_1")])
+    assert cache.get("derived", "device_1-january") is None
+    assert cache.get("derived", "device_1-february") == b"2"
+    assert cache.get("derived", "device_2-january") == b"3"
+
+
+def test_invalidate_drops_fleet_entries_of_written_window(cache):
+    cache.invalidate([row(datetime(2024, 1, 15), "device_3")])
+    assert cache.get("aggregates", "january") is None
+    assert cache.get("aggregates", "february") == b"5"
+    # Unbounded results cover every window
+    assert cache.get("data", "all") is None
+    assert cache.get("derived", "device_1-january") == b"1"
+
+
+def test_window_end_is_exclusive(cache):
+    cache.invalidate([row(FEBRUARY[0], "device_1")])
+    assert cache.get("derived", "device_1-january") == b"1"
+    assert cache.get("derived", "device_1-february") is None
+
+
+def test_size_bound_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=10)
+    cache.put("data", "a", b"aaaa")
+    cache.put("data", "b", b"bbbb")
+    cache.get("data", "a")
+    cache.put("data", "c", b"cccc")
+    assert cache.size == 8
+    assert cache.get("data", "b") is None
+    assert cache.get("data", "a") == b"aaaa"
+    assert cache.get("data", "c") == b"cccc"
+
+
+def test_bodies_larger_than_the_cache_are_not_stored():
+    cache = ResultCache(max_bytes=10)
+    cache.put("data", "a", b"a" * 11)
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_replacing_an_entry_keeps_size_accurate():
+    cache = ResultCache(max_bytes=10)
+    cache.put("data", "a", b"aaaa")
+    cache.put("data", "a", b"aa")
+    assert cache.size == 2
+
+
+def test_open_and_closed_entries_expire_after_their_ttl(cache, monkeypatch):
+    now = cache_module.time.monotonic()
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now + 60)
+    assert cache.get("data", "all") is None
+    assert cache.get("aggregates", "january") == b"4"
+
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now + 601)
+    assert cache.get("aggregates", "january") is None
+
+
+def test_default_end_is_stable_within_rounding():
+    assert default_end(datetime(2024, 1, 1, 12, 0, 1), 10) == datetime(2024, 1, 1, 12, 0, 10)
+    assert default_end(datetime(2024, 1, 1, 12, 0, 9, 999999), 10) == datetime(2024, 1, 1, 12, 0, 10)
+    assert default_end(datetime(2024, 1, 1, 12, 0, 10), 10) == datetime(2024, 1, 1, 12, 0, 10)
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from common.wire_format import HEADER, JSON, MSGPACK_V1, decode, encode, header_format, to_epoch_ms
+
+RECORD = {"timestamp": "2025-01-01T12:34:56.789000", "voltage": 231.5, "current": 2.25,
+          "device_type": "Controller", "location": "warehouse"}
+
+
+@pytest.mark.parametrize("wire_format", [JSON, MSGPACK_V1])
+def test_round_trip(wire_format):
+    value, headers = encode(RECORD, wire_format)
+    assert headers == [(HEADER, wire_format.encode("utf-8"))]
+    assert decode(value, headers) == RECORD
+
+
+def test_msgpack_keeps_values_missing_from_code_tables():
+    record = dict(RECORD, device_type="Gateway", location="roof")
+    value, headers = encode(record, MSGPACK_V1)
+    assert decode(value, headers) == record
+
+
+def test_msgpack_is_smaller_than_json():
+    assert len(encode(RECORD, MSGPACK_V1)[0]) < len(encode(RECORD, JSON)[0])
+
+
+def test_encode_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        encode(RECORD, "avro")
+
+
+@pytest.mark.parametrize("headers, expected", [
+    (None, JSON),
+    ([], JSON),
+    ([("trace-id", b"abc")], JSON),
+    ([(HEADER, b"msgpack-v1")], MSGPACK_V1),
+    ([(HEADER, "msgpack-v1")], MSGPACK_V1),
+])
+def test_header_format(headers, expected):
+    assert header_format(headers) == expected
+
+
+def test_decode_without_headers_reads_json():
+    # Messages produced before the header existed
+    assert decode(json.dumps(RECORD).encode("utf-8"), None) == RECORD
+
+
+def test_decode_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        decode(b"", [(HEADER, b"avro")])
+
+
+def test_to_epoch_ms_converts_aware_timestamps_to_utc():
+    assert to_epoch_ms("2025-01-01T14:00:00+02:00") == to_epoch_ms("2025-01-01T12:00:00")
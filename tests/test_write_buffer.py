@@ -0,0 +1,127 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+
+from benchmarks.stand_ins import FakePool, api_client
+from db import write_buffer as write_buffer_module
+from db.write_buffer import BufferFullError, WriteBehindBuffer
+
+
+class RecordingConnection:
+    """Records every batch written, failing the first ``failures`` attempts."""
+
+    def __init__(self, failures: int = 0):
+        self.batches = []
+        self.failures = failures
+
+    async def executemany(self, query, rows):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        self.batches.append(list(rows))
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    connection = RecordingConnection()
+
+    @asynccontextmanager
+    async def acquire():
+        yield connection
+
+    monkeypatch.setattr(write_buffer_module, "acquire", acquire)
+    return connection
+
+
+def row(i: int) -> tuple:
+    return datetime(2024, 1, 1, 0, 0, i), f"device_{i}", 230.0, 1.5, "sensor", "lab"
+
+
+def test_flushes_once_flush_max_rows_are_buffered(connection):
+    async def scenario():
+        buffer = WriteBehindBuffer(flush_interval_ms=60000, flush_max_rows=3, max_rows=10)
+        await buffer.start()
+        for i in range(3):
+            buffer.put(row(i))
+        await asyncio.sleep(0.05)
+        written = list(connection.batches)
+        await buffer.stop()
+        return written
+
+    assert asyncio.run(scenario()) == [[row(0), row(1), row(2)]]
+
+
+def test_flushes_after_flush_interval(connection):
+    async def scenario():
+        buffer = WriteBehindBuffer(flush_interval_ms=20, flush_max_rows=100, max_rows=100)
+        await buffer.start()
+        buffer.put(row(0))
+        await asyncio.sleep(0.1)
+        written = list(connection.batches)
+        await buffer.stop()
+        return written
+
+    assert asyncio.run(scenario()) == [[row(0)]]
+
+
+def test_put_raises_when_full():
+    buffer = WriteBehindBuffer(flush_max_rows=10, max_rows=2)
+    buffer.put(row(0))
+    buffer.put(row(1))
+    with pytest.raises(BufferFullError):
+        buffer.put(row(2))
+    assert len(buffer) == 2
+
+
+def test_stop_drains_buffered_rows_in_batches(connection):
+    async def scenario():
+        buffer = WriteBehindBuffer(flush_interval_ms=60000, flush_max_rows=2, max_rows=10)
+        # Rows put before start() wait for the first flush
+        for i in range(5):
+            buffer.put(row(i))
+        await buffer.start()
+        await buffer.stop()
+        return len(buffer)
+
+    assert asyncio.run(scenario()) == 0
+    assert [len(batch) for batch in connection.batches] == [2, 2, 1]
+
+
+def test_listeners_get_written_and_dropped_batches(connection, monkeypatch):
+    monkeypatch.setattr(write_buffer_module, "INGEST_FLUSH_RETRIES", 2)
+    written, dropped = [], []
+
+    def failing_listener(batch):
+        raise RuntimeError("listener bug")
+
+    async def scenario():
+        buffer = WriteBehindBuffer(flush_interval_ms=1, flush_max_rows=10, max_rows=10)
+        buffer.add_flush_listener(failing_listener)
+        buffer.add_flush_listener(written.extend)
+        buffer.add_drop_listener(dropped.extend)
+        buffer.put(row(0))
+        connection.failures = 2
+        await buffer.flush()
+        buffer.put(row(1))
+        await buffer.flush()
+
+    asyncio.run(scenario())
+    assert dropped == [row(0)]
+    assert written == [row(1)]
+
+
+def test_ingest_returns_429_when_buffer_is_full(monkeypatch):
+    from db.write_buffer import write_buffer
+
+    monkeypatch.setattr(write_buffer, "max_rows", 0)
+    reading = {"device_id": "device_1", "voltage": 230.0, "current": 1.5, "device_type": "sensor", "location": "lab"}
+
+    async def scenario():
+        async with api_client(FakePool()) as client:
+            return await client.post("/data", json=reading)
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"